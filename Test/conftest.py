@@ -0,0 +1,34 @@
+import os
+import uuid
+
+import pytest
+
+from api import mongo
+
+
+@pytest.fixture
+def db():
+    """Point the shared client at an in-memory mongomock database, emptied per test"""
+    mongomock = pytest.importorskip("mongomock")
+    if not isinstance(mongo._client, mongomock.MongoClient):
+        mongo._client = mongomock.MongoClient()
+    mongo._client.drop_database(mongo.DATABASE_NAME)
+    yield mongo._client[mongo.DATABASE_NAME]
+    mongo._client.drop_database(mongo.DATABASE_NAME)
+
+
+@pytest.fixture
+def server_db():
+    """A scratch database on a real MongoDB server, for pipelines mongomock cannot run.
+
+    Set MONGO_TEST_URI to run these tests; they are skipped otherwise.
+    """
+    uri = os.getenv("MONGO_TEST_URI")
+    if not uri:
+        pytest.skip("MONGO_TEST_URI is not set")
+    from pymongo import MongoClient
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    database = client[f"bookstore_test_{uuid.uuid4().hex[:8]}"]
+    yield database
+    client.drop_database(database.name)
+    client.close()
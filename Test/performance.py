@@ -213,6 +213,15 @@ class SimpleMongoPerformanceTester:
             sort_orders_by_date
         )
         
+        # Test 4: One customer's orders by date (served by the CustomerID + OrderDate index)
+        def customer_orders_by_date():
+            return list(self.orders.find({"CustomerID": 1003}).sort("OrderDate", -1))
+        
+        results['customer_orders_by_date'] = self.time_operation(
+            "Customer Orders by Date DESC (ID=1003)", 
+            customer_orders_by_date
+        )
+        
         return results
     
     # Get basic collection statistics
@@ -0,0 +1,158 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+from api import analytics
+
+START = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Seconds since START; analytics sees it as the current time"""
+    clock = {"now": 0}
+
+    class FakeDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return START + timedelta(seconds=clock["now"])
+    monkeypatch.setattr(analytics, "datetime", FakeDatetime)
+    monkeypatch.setattr(analytics, "SETTLE_SECONDS", 60)
+    return clock
+
+
+def add_order(db, clock, order_id):
+    """Insert an order the way the driver does: its _id is stamped with the current time"""
+    timestamp = ObjectId.from_datetime(START + timedelta(seconds=clock["now"])).binary[:4]
+    db.orders.insert_one({"_id": ObjectId(timestamp + os.urandom(8)), "OrderID": order_id,
+                          "BookIDQuantity": {"1": 1}})
+
+
+@pytest.fixture
+def merges(db, monkeypatch):
+    """Record the OrderIDs each summary is asked to merge instead of running $merge"""
+    calls = {summary: [] for summary in analytics.SALES_SUMMARIES}
+
+    def record(summary):
+        return lambda window, high: calls[summary].append(
+            sorted(order["OrderID"] for order in db.orders.find(window)))
+    for summary in calls:
+        monkeypatch.setitem(analytics.SALES_SUMMARIES, summary, record(summary))
+    calls["record"] = record
+    return calls
+
+
+def test_each_summary_advances_its_own_watermark(db, clock, merges):
+    add_order(db, clock, 1)
+    add_order(db, clock, 2)
+    clock["now"] = 100
+    assert analytics.refresh_sales_summaries() == 2
+
+    add_order(db, clock, 3)
+    clock["now"] = 200
+    assert analytics.refresh_sales_summaries() == 1
+    assert analytics.refresh_sales_summaries() == 0
+
+    assert merges["book_sales_summary"] == [[1, 2], [3]]
+    assert merges["daily_revenue_summary"] == [[1, 2], [3]]
+
+
+def test_order_inserted_after_a_higher_order_id_is_still_counted(db, clock, merges):
+    # OrderID 10 was allocated first but its insert landed after OrderID 11's and a refresh
+    add_order(db, clock, 11)
+    clock["now"] = 100
+    analytics.refresh_sales_summaries()
+    add_order(db, clock, 10)
+    clock["now"] = 200
+    analytics.refresh_sales_summaries()
+
+    assert merges["book_sales_summary"] == [[11], [10]]
+    assert merges["daily_revenue_summary"] == [[11], [10]]
+
+
+def test_orders_within_the_settle_lag_wait_for_a_later_refresh(db, clock, merges):
+    add_order(db, clock, 1)
+    clock["now"] = 100
+    add_order(db, clock, 2)
+
+    analytics.refresh_sales_summaries()
+    clock["now"] = 200
+    analytics.refresh_sales_summaries()
+
+    assert merges["book_sales_summary"] == [[1], [2]]
+
+
+def test_failed_merge_is_retried_with_the_same_window(db, clock, merges, monkeypatch):
+    add_order(db, clock, 1)
+    add_order(db, clock, 2)
+    clock["now"] = 100
+
+    def fail(window, high):
+        raise RuntimeError("merge failed")
+    monkeypatch.setitem(analytics.SALES_SUMMARIES, "daily_revenue_summary", fail)
+    with pytest.raises(RuntimeError):
+        analytics.refresh_sales_summaries()
+
+    # More orders arrive before the retry; the pending window must not grow
+    add_order(db, clock, 3)
+    clock["now"] = 200
+    monkeypatch.setitem(analytics.SALES_SUMMARIES, "daily_revenue_summary",
+                        merges["record"]("daily_revenue_summary"))
+    analytics.refresh_sales_summaries()
+
+    # book_sales_summary committed its window and is not asked to merge 1..2 again
+    assert merges["book_sales_summary"] == [[1, 2], [3]]
+    assert merges["daily_revenue_summary"] == [[1, 2]]
+    assert "PendingThrough" not in db.analytics_state.find_one({"_id": "daily_revenue_summary"})
+
+    analytics.refresh_sales_summaries()
+    assert merges["daily_revenue_summary"] == [[1, 2], [3]]
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    from flask import Flask
+    monkeypatch.setattr(analytics, "ANALYTICS_TOKEN", "back-office")
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.register_blueprint(analytics.analytics_bp, url_prefix='/api/analytics')
+    return app.test_client()
+
+
+def test_reports_require_the_analytics_token(client):
+    with client.session_transaction() as session:
+        session['currentUser'] = {'CustomerID': 1}
+
+    assert client.get('/api/analytics/top-sellers').status_code == 403
+    assert client.get('/api/analytics/top-sellers', headers={'X-Analytics-Token': 'wrong'}).status_code == 403
+    assert client.get('/api/analytics/top-sellers', headers={'X-Analytics-Token': 'back-office'}).status_code == 200
+
+
+def test_reports_are_disabled_without_a_configured_token(client, monkeypatch):
+    monkeypatch.setattr(analytics, "ANALYTICS_TOKEN", None)
+
+    assert client.get('/api/analytics/low-stock', headers={'X-Analytics-Token': ''}).status_code == 403
+
+
+def test_refresh_is_not_exposed_over_http(client):
+    response = client.post('/api/analytics/refresh', headers={'X-Analytics-Token': 'back-office'})
+    assert response.status_code in (404, 405)
+
+
+@pytest.mark.parametrize('query', ['limit=0', 'limit=-5'])
+def test_top_sellers_limit_cannot_be_lifted(db, client, query):
+    db.book_sales_summary.insert_many([{"_id": book_id, "UnitsSold": book_id} for book_id in range(5)])
+
+    response = client.get(f'/api/analytics/top-sellers?{query}', headers={'X-Analytics-Token': 'back-office'})
+
+    assert [entry['BookID'] for entry in response.get_json()] == [4]
+
+
+def test_revenue_days_cannot_be_lifted(db, client):
+    db.daily_revenue_summary.insert_many([{"_id": f"2025-01-0{day}", "Revenue": 1} for day in range(1, 4)])
+
+    response = client.get('/api/analytics/revenue-by-day?days=0', headers={'X-Analytics-Token': 'back-office'})
+
+    assert [entry['Date'] for entry in response.get_json()] == ["2025-01-03"]
@@ -0,0 +1,68 @@
+import pytest
+
+from api import book_index
+from api.book_index import BookIndex
+
+
+@pytest.mark.parametrize('bad_book', [
+    {"BookID": "4", "BookPrice": 1.0},
+    {"BookID": 4.0, "BookPrice": 1.0},
+    {"BookID": 2 ** 31, "BookPrice": 1.0},
+    {"BookID": 4, "BookPrice": "1.00"},
+    {"BookID": 4, "BookPrice": 1e12},
+    {"BookID": 4, "BookPrice": float("nan")},
+    {"BookID": 4},
+])
+def test_reload_skips_books_that_cannot_be_indexed(db, bad_book):
+    db.books.insert_many([
+        {"BookID": 1, "BookTitle": "Dune", "BookPrice": 9.99},
+        dict(bad_book, BookTitle="Broken"),
+        {"BookID": 5, "BookTitle": 42, "BookPrice": 3},
+    ])
+    index = BookIndex(db.books)
+
+    index.reload()
+
+    assert index.loaded
+    assert index.stats()['books'] == 2
+    assert index.lookup(1) == (9.99, "Dune")
+    assert index.lookup(5) == (3.0, "")
+
+
+def test_changes_with_invalid_prices_are_ignored(db):
+    index = BookIndex(db.books)
+
+    index._apply_change({"operationType": "insert", "fullDocument": {"BookID": 4, "BookPrice": "cheap"}})
+    index._apply_change({"operationType": "insert", "fullDocument": {"BookID": 5, "BookPrice": 2.5,
+                                                                     "BookTitle": "Emma"}})
+
+    assert index.lookup(4) is None
+    assert index.lookup(5) == (2.5, "Emma")
+
+
+def test_book_whose_price_becomes_invalid_is_dropped(db):
+    db.books.insert_one({"BookID": 1, "BookTitle": "Dune", "BookPrice": 9.99})
+    index = BookIndex(db.books)
+    index.reload()
+
+    index._apply_change({"operationType": "update", "fullDocument": {"BookID": 1, "BookPrice": None}})
+
+    assert index.lookup(1) is None
+
+
+def test_unexpected_errors_do_not_end_the_index_thread(db, monkeypatch):
+    index = BookIndex(db.books)
+    attempts = []
+
+    def watch_changes():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise TypeError("unexpected")
+        raise SystemExit
+    monkeypatch.setattr(index, "_watch_changes", watch_changes)
+    monkeypatch.setattr(book_index.time, "sleep", lambda seconds: None)
+
+    with pytest.raises(SystemExit):
+        index._run()
+
+    assert len(attempts) == 3
@@ -0,0 +1,63 @@
+import pytest
+
+from api import cart_quote
+from api.book_index import BookIndex
+
+
+@pytest.fixture
+def books(db, monkeypatch):
+    db.books.insert_many([
+        {"BookID": 0, "BookTitle": "Attack on Titan: Volume 13", "BookPrice": 43.28, "BookQuantity": 2},
+        {"BookID": 1, "BookTitle": "Dune", "BookPrice": 9.99, "BookQuantity": 3},
+        {"BookID": 2, "BookTitle": "Emma", "BookPrice": 5.5, "BookQuantity": 1},
+    ])
+    index = BookIndex(db.books)
+    index.reload()
+    monkeypatch.setattr(cart_quote, "book_index", index)
+    return index
+
+
+def test_duplicate_lines_are_priced_and_stock_checked_together(books):
+    quote = cart_quote.quote_cart([{'bookID': 1, 'quantity': 2}, {'bookID': 1, 'quantity': 1}])
+
+    assert quote['valid']
+    assert quote['totalItems'] == 3
+    assert quote['totalPrice'] == 29.97
+    assert quote['bookIDQuantity'] == {'1': 3}
+
+
+def test_stock_is_checked_against_the_whole_cart(books):
+    quote = cart_quote.quote_cart([{'bookID': 2, 'quantity': 1}, {'bookID': 2, 'quantity': 1}])
+
+    assert not quote['valid']
+    assert cart_quote.first_error(quote)[1] == 400
+
+
+def test_book_id_zero_can_be_quoted(books):
+    quote = cart_quote.quote_cart([{'bookID': 0, 'quantity': 1}])
+
+    assert quote['valid']
+    assert quote['lines'][0]['BookTitle'] == "Attack on Titan: Volume 13"
+    assert quote['bookIDQuantity'] == {'0': 1}
+
+
+def test_unknown_book_is_not_found(books):
+    quote = cart_quote.quote_cart([{'bookID': 99, 'quantity': 1}])
+
+    assert cart_quote.first_error(quote) == ('Book with ID 99 not found', 404)
+
+
+@pytest.mark.parametrize('book_id', ["2", [2], {"id": 2}, True, 2.0, None])
+def test_non_int_book_ids_are_invalid_lines(books, book_id):
+    quote = cart_quote.quote_cart([{'bookID': book_id, 'quantity': 1}])
+
+    assert quote['lines'][0]['status'] == 'invalid'
+    assert cart_quote.first_error(quote)[1] == 400
+
+
+@pytest.mark.parametrize('book_id', ["2", [2], True, 2.5])
+def test_book_index_lookup_ignores_non_int_keys(books, book_id):
+    books._overlay = {3: (1.0, "Persuasion")}
+
+    assert books.lookup(book_id) is None
+    assert books.lookup(2) == (5.5, "Emma")
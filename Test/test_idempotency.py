@@ -0,0 +1,109 @@
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask, jsonify, request
+
+from api import idempotency
+
+
+@pytest.fixture
+def view_calls():
+    return []
+
+
+@pytest.fixture
+def client(db, monkeypatch, view_calls):
+    monkeypatch.setattr(idempotency, "_indexes_ensured", False)
+    monkeypatch.setattr(idempotency, "WAIT_TIMEOUT_SECONDS", 0.2)
+    monkeypatch.setattr(idempotency, "POLL_INTERVAL_SECONDS", 0.01)
+    app = Flask(__name__)
+    app.secret_key = "test"
+
+    @app.route('/create', methods=['POST'])
+    @idempotency.idempotent
+    def create():
+        view_calls.append(request.get_json())
+        status = request.get_json().get('status', 201)
+        return jsonify({'orderID': len(view_calls)}), status
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['currentUser'] = {'CustomerID': 7}
+    return client
+
+
+def post(client, body, key='key-1'):
+    return client.post('/create', json=body, headers={'Idempotency-Key': key})
+
+
+def test_repeated_key_replays_the_stored_response(client, view_calls):
+    first = post(client, {'books': [1]})
+    second = post(client, {'books': [1]})
+
+    assert len(view_calls) == 1
+    assert second.status_code == 201
+    assert second.get_json() == first.get_json()
+    assert second.headers['Idempotent-Replayed'] == 'true'
+
+
+def test_key_reused_with_a_different_body_is_rejected(client, view_calls):
+    post(client, {'books': [1]})
+
+    response = post(client, {'books': [2]})
+
+    assert response.status_code == 422
+    assert len(view_calls) == 1
+
+
+def test_keys_are_scoped_per_customer(client, view_calls):
+    post(client, {'books': [1]})
+    with client.session_transaction() as session:
+        session['currentUser'] = {'CustomerID': 8}
+
+    post(client, {'books': [1]})
+
+    assert len(view_calls) == 2
+
+
+@pytest.mark.parametrize('status', [400, 404, 500])
+def test_error_responses_release_the_key(client, view_calls, db, status):
+    assert post(client, {'status': status}).status_code == status
+    assert db.idempotency_keys.count_documents({}) == 0
+
+    retry = post(client, {'status': status})
+
+    assert len(view_calls) == 2
+    assert 'Idempotent-Replayed' not in retry.headers
+
+
+def test_expired_lease_is_taken_over(client, view_calls, db):
+    body = b'{"books": [1]}'
+    db.idempotency_keys.insert_one({
+        "Key": "key-1", "CustomerID": 7, "Fingerprint": hashlib.sha256(body).hexdigest(),
+        "Status": "in_progress", "CreatedAt": datetime.utcnow(),
+        "LockedUntil": datetime.utcnow() - timedelta(seconds=1)
+    })
+
+    response = client.post('/create', data=body, content_type='application/json',
+                           headers={'Idempotency-Key': 'key-1'})
+
+    assert response.status_code == 201
+    assert len(view_calls) == 1
+    assert db.idempotency_keys.find_one({"Key": "key-1"})["Status"] == "completed"
+
+
+def test_duplicate_of_a_live_attempt_gives_up_with_409(client, view_calls, db):
+    body = b'{"books": [1]}'
+    db.idempotency_keys.insert_one({
+        "Key": "key-1", "CustomerID": 7, "Fingerprint": hashlib.sha256(body).hexdigest(),
+        "Status": "in_progress", "CreatedAt": datetime.utcnow(),
+        "LockedUntil": datetime.utcnow() + timedelta(seconds=60)
+    })
+
+    response = client.post('/create', data=body, content_type='application/json',
+                           headers={'Idempotency-Key': 'key-1'})
+
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    assert view_calls == []
@@ -0,0 +1,39 @@
+import gzip
+import json
+
+from api import order_export, order_storage
+
+
+def add_orders(collection, customer_id, *order_ids):
+    collection.insert_many([{
+        "OrderID": order_id, "CustomerID": customer_id, "OrderDate": "2025-01-01T10:00:00",
+        "OrderPrice": 5.5, "BookIDQuantity": {"1": 1}
+    } for order_id in order_ids])
+
+
+def test_batches_page_through_each_collection_by_order_id(db):
+    add_orders(db.orders_archive, 7, 1, 2)
+    add_orders(db.orders, 7, 5, 3, 4, 6)
+    add_orders(db.orders, 8, 9)
+
+    batches = list(order_export.iter_order_batches(7, 2, [db.orders_archive, db.orders]))
+
+    assert [[order["OrderID"] for order in batch] for batch in batches] == [[1, 2], [3, 4], [5, 6]]
+
+
+def test_ndjson_export_joins_books_and_gzips(db):
+    db.books.insert_one({"BookID": 1, "BookTitle": "Dune", "AuthorName": "Herbert", "BookPrice": 5.5})
+    add_orders(db.orders, 7, 1, 2, 3)
+
+    body = b''.join(order_export.export_orders(7, 'ndjson', True, 2, [db.orders]))
+    orders = [json.loads(line) for line in gzip.decompress(body).splitlines()]
+
+    assert [order["OrderID"] for order in orders] == [1, 2, 3]
+    assert orders[0]["books"][0]["BookTitle"] == "Dune"
+
+
+def test_order_indexes_cover_the_export_sort(db):
+    order_storage.ensure_order_indexes()
+
+    keys = [index["key"] for index in db.orders.index_information().values()]
+    assert [("CustomerID", 1), ("OrderID", 1)] in keys
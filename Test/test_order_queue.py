@@ -0,0 +1,126 @@
+from datetime import datetime
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from api import order_queue, order_storage
+
+
+def add_book(db, book_id, quantity):
+    db.books.insert_one({"BookID": book_id, "BookTitle": f"Book {book_id}", "BookPrice": 10.0,
+                         "BookQuantity": quantity})
+
+
+def stock(db, book_id):
+    return db.books.find_one({"BookID": book_id})["BookQuantity"]
+
+
+def queue_order(db, order_id, book_id_quantity, attempts=1, claim_token="claim-1"):
+    db.order_queue.insert_one({
+        "_id": order_id,
+        "Order": {"OrderID": order_id, "CustomerID": 1, "BookIDQuantity": book_id_quantity,
+                  "OrderPrice": 10.0, "OrderDate": datetime.utcnow().isoformat()},
+        "Status": "processing",
+        "ClaimToken": claim_token,
+        "Attempts": attempts,
+        "EnqueuedAt": datetime.utcnow()
+    })
+    return db.order_queue.find_one({"_id": order_id})
+
+
+def test_reserve_stock_refuses_the_last_copy_twice(db):
+    add_book(db, 1, 1)
+
+    assert order_queue.reserve_stock({"1": 1}) is None
+    assert order_queue.reserve_stock({"1": 1}) == 1
+    assert stock(db, 1) == 0
+
+
+def test_reserve_stock_rolls_back_a_partly_reserved_order(db):
+    add_book(db, 1, 5)
+    add_book(db, 2, 1)
+
+    assert order_queue.reserve_stock({"1": 2, "2": 3}) == 2
+    assert stock(db, 1) == 5
+    assert stock(db, 2) == 1
+
+
+def test_retried_batch_does_not_touch_stock_again(db):
+    add_book(db, 1, 10)
+    assert order_queue.reserve_stock({"1": 3}) is None
+    entry = queue_order(db, 100, {"1": 3})
+
+    order_queue._process_batch([entry])
+    # A retry after e.g. the completion update failed
+    db.order_queue.update_one({"_id": 100}, {"$set": {"Status": "processing", "ClaimToken": "claim-2", "Attempts": 2}})
+    order_queue._process_batch([db.order_queue.find_one({"_id": 100})])
+
+    assert db.orders.count_documents({"OrderID": 100}) == 1
+    assert stock(db, 1) == 7
+
+
+def test_release_batch_completes_inserted_entries_and_fails_the_rest(db):
+    add_book(db, 1, 10)
+    assert order_queue.reserve_stock({"1": 2}) is None
+    assert order_queue.reserve_stock({"1": 3}) is None
+    inserted = queue_order(db, 100, {"1": 2}, attempts=order_queue.MAX_ATTEMPTS)
+    lost = queue_order(db, 101, {"1": 3}, attempts=order_queue.MAX_ATTEMPTS)
+    db.orders.insert_one(dict(inserted["Order"]))
+
+    order_queue._release_batch([inserted, lost], RuntimeError("write failed"))
+    # Releasing twice must not return the stock twice
+    order_queue._release_batch([inserted, lost], RuntimeError("write failed"))
+
+    assert db.order_queue.find_one({"_id": 100})["Status"] == "completed"
+    failed = db.order_queue.find_one({"_id": 101})
+    assert failed["Status"] == "failed"
+    assert "write failed" in failed["Error"]
+    assert stock(db, 1) == 8
+
+
+def test_release_batch_requeues_entries_with_attempts_left(db):
+    entry = queue_order(db, 100, {"1": 1}, attempts=1)
+
+    order_queue._release_batch([entry], RuntimeError("write failed"))
+
+    assert db.order_queue.find_one({"_id": 100})["Status"] == "queued"
+
+
+def test_reclaimed_entry_is_not_inserted_twice(db, monkeypatch):
+    order_storage.ensure_order_indexes()
+    add_book(db, 1, 10)
+    first_claim = queue_order(db, 100, {"1": 1})
+    # The claim timed out while the first worker was still inserting; a second worker takes over
+    db.order_queue.update_one({"_id": 100}, {"$set": {"ClaimToken": "claim-2"}, "$inc": {"Attempts": 1}})
+    second_claim = db.order_queue.find_one({"_id": 100})
+
+    # The first worker's insert lands, but its completion no longer owns the entry
+    order_queue._process_batch([first_claim])
+    assert db.order_queue.find_one({"_id": 100})["Status"] == "processing"
+
+    # The second worker checked for an existing order before the first insert landed
+    with monkeypatch.context() as patch:
+        patch.setattr(order_queue, "_inserted_ids", lambda entry_ids: set())
+        with pytest.raises(BulkWriteError):
+            order_queue._process_batch([second_claim])
+    order_queue._release_batch([second_claim], RuntimeError("duplicate"))
+
+    assert db.orders.count_documents({"OrderID": 100}) == 1
+    assert db.order_queue.find_one({"_id": 100})["Status"] == "completed"
+    assert stock(db, 1) == 10
+
+
+def test_completion_is_scoped_to_the_current_claim(db):
+    queue_order(db, 100, {"1": 1}, claim_token="claim-2")
+
+    order_queue._mark_completed([100], "claim-1")
+
+    assert db.order_queue.find_one({"_id": 100})["Status"] == "processing"
+
+
+def test_existing_non_unique_order_id_index_is_replaced(db):
+    db.orders.create_index("OrderID")
+
+    order_storage.ensure_order_indexes()
+
+    assert db.orders.index_information()["OrderID_1"].get("unique")
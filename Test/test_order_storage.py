@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from api import order_queue, order_storage
+
+
+def test_string_mode_writes_utc_with_an_offset(monkeypatch):
+    monkeypatch.setattr(order_storage, "ORDER_DATE_STORAGE", "string")
+
+    stamp = datetime.fromisoformat(order_storage.order_timestamp())
+
+    assert stamp.utcoffset() == timedelta(0)
+    assert abs(datetime.now(timezone.utc) - stamp) < timedelta(seconds=5)
+
+
+def test_date_mode_writes_utc_dates(monkeypatch):
+    monkeypatch.setattr(order_storage, "ORDER_DATE_STORAGE", "date")
+
+    assert order_storage.order_timestamp().tzinfo == timezone.utc
+
+
+def test_archive_cutoff_matches_both_date_types(db):
+    cutoff = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    db.orders.insert_many([
+        {"OrderID": 1, "OrderDate": "2024-06-01T10:00:00"},
+        {"OrderID": 2, "OrderDate": "2024-12-31T23:00:00+00:00"},
+        {"OrderID": 3, "OrderDate": datetime(2024, 12, 1)},
+        {"OrderID": 4, "OrderDate": "2025-01-01T00:00:01+00:00"},
+        {"OrderID": 5, "OrderDate": datetime(2025, 2, 1)},
+    ])
+
+    old = db.orders.find(order_storage._older_than(cutoff))
+
+    assert sorted(order["OrderID"] for order in old) == [1, 2, 3]
+
+
+def test_batches_visit_every_matching_order_once(db, monkeypatch):
+    monkeypatch.setattr(order_storage, "MIGRATION_BATCH_SIZE", 3)
+    db.orders.insert_many([{"OrderID": order_id, "Old": order_id % 2 == 0} for order_id in range(10)])
+
+    batches = list(order_storage._batches_of_ids(db.orders, {"Old": True}))
+
+    assert [len(ids) for ids in batches] == [3, 2]
+    assert len({oid for ids in batches for oid in ids}) == 5
+
+
+def test_order_id_counter_is_seeded_above_archived_orders(db):
+    db.orders_archive.insert_one({"OrderID": 500})
+    db.orders.insert_one({"OrderID": 20})
+    db.order_queue.insert_one({"_id": 30})
+
+    assert order_queue.allocate_order_id() == 501
+    assert order_queue.allocate_order_id() == 502
+
+
+@pytest.fixture
+def server_storage(server_db, monkeypatch):
+    monkeypatch.setattr(order_storage, "orders_collection", server_db.orders)
+    monkeypatch.setattr(order_storage, "orders_archive", server_db.orders_archive)
+    return server_db
+
+
+def test_migration_converts_legacy_and_utc_strings(server_storage):
+    server_storage.orders.insert_many([
+        {"OrderID": 1, "OrderDate": "2025-03-01T10:00:00"},
+        {"OrderID": 2, "OrderDate": "2025-03-01T10:00:00+00:00"},
+        {"OrderID": 3, "OrderDate": "not a date"},
+    ])
+
+    order_storage.migrate_string_dates("Africa/Johannesburg")
+
+    dates = {order["OrderID"]: order["OrderDate"] for order in server_storage.orders.find()}
+    assert dates[1] == datetime(2025, 3, 1, 8, 0)
+    assert dates[2] == datetime(2025, 3, 1, 10, 0)
+    assert dates[3] == "not a date"
+
+
+def test_archive_moves_only_old_orders_and_keeps_existing_copies(server_storage):
+    old_date = datetime.now(timezone.utc) - timedelta(days=400)
+    server_storage.orders.insert_many([
+        {"_id": 1, "OrderID": 1, "OrderDate": old_date},
+        {"_id": 2, "OrderID": 2, "OrderDate": old_date.replace(tzinfo=None).isoformat()},
+        {"_id": 3, "OrderID": 3, "OrderDate": datetime.now(timezone.utc)},
+    ])
+    # A copy left behind by an interrupted earlier run
+    server_storage.orders_archive.insert_one({"_id": 1, "OrderID": 1, "OrderDate": old_date})
+
+    assert order_storage.archive_orders(365) == 2
+
+    assert [order["OrderID"] for order in server_storage.orders.find()] == [3]
+    assert sorted(order["OrderID"] for order in server_storage.orders_archive.find()) == [1, 2]
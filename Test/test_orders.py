@@ -0,0 +1,54 @@
+import pytest
+
+from api import orders
+from api.book_index import BookIndex
+
+
+@pytest.fixture
+def catalog(db, monkeypatch):
+    db.books.insert_many([
+        {"BookID": 1, "BookTitle": "Dune", "AuthorName": "Herbert", "BookPrice": 9.99, "BookPublisher": "Chilton"},
+        {"BookID": 2, "BookTitle": "Emma", "AuthorName": "Austen", "BookPrice": 5.5},
+    ])
+    index = BookIndex(db.books)
+    index.reload()
+    monkeypatch.setattr(orders, "book_index", index)
+    monkeypatch.setattr(orders, "catalog_books", db.books)
+    return index
+
+
+def test_order_enrichment_reads_the_catalog_once(db, catalog, monkeypatch):
+    history = [{"BookIDQuantity": {"1": 2}}, {"BookIDQuantity": {"1": 1, "2": 1}}]
+    finds = []
+    monkeypatch.setattr(orders, "catalog_books", type("Spy", (), {
+        "find": lambda self, *args: finds.append(args) or db.books.find(*args)
+    })())
+
+    details = orders._book_details_for(history)
+
+    assert len(finds) == 1
+    # Title and price come from the index, so they are not fetched
+    assert "BookTitle" not in finds[0][1]
+    assert orders._order_lines(history[1], details) == [
+        {"BookID": 1, "BookTitle": "Dune", "AuthorName": "Herbert", "BookPrice": 9.99,
+         "BookPublisher": "Chilton", "BookPublicationDate": "Unknown Date", "quantity": 1},
+        {"BookID": 2, "BookTitle": "Emma", "AuthorName": "Austen", "BookPrice": 5.5,
+         "BookPublisher": "Unknown Publisher", "BookPublicationDate": "Unknown Date", "quantity": 1},
+    ]
+
+
+def test_order_enrichment_falls_back_to_mongo_before_the_index_loads(db, catalog, monkeypatch):
+    monkeypatch.setattr(orders, "book_index", BookIndex(db.books))
+
+    details = orders._book_details_for([{"BookIDQuantity": {"2": 1}}])
+
+    assert details[2]["BookTitle"] == "Emma"
+    assert details[2]["BookPrice"] == 5.5
+
+
+def test_books_no_longer_in_the_catalog_are_left_out(db, catalog):
+    order = {"BookIDQuantity": {"1": 1, "3": 4}}
+
+    lines = orders._order_lines(order, orders._book_details_for([order]))
+
+    assert [line["BookID"] for line in lines] == [1]
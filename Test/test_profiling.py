@@ -0,0 +1,52 @@
+import pytest
+from flask import Flask
+
+from api import profiling
+
+
+@pytest.fixture
+def make_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 0)
+
+    def make_client(token):
+        monkeypatch.setattr(profiling, "PROFILE_TOKEN", token)
+        app = Flask(__name__)
+        app.add_url_rule('/ping', 'ping', lambda: 'pong')
+        profiling.init_profiling(app)
+        return app.test_client()
+    return make_client
+
+
+def test_without_a_token_the_header_trigger_and_admin_routes_are_off(make_client, tmp_path):
+    client = make_client(None)
+
+    response = client.get('/ping', headers={'X-Profile': 'sample'})
+
+    assert 'X-Profile-File' not in response.headers
+    assert list(tmp_path.iterdir()) == []
+    assert client.get('/api/admin/profiles').status_code == 404
+
+
+def test_with_a_token_only_matching_requests_are_profiled(make_client, tmp_path):
+    client = make_client("secret")
+
+    assert 'X-Profile-File' not in client.get('/ping', headers={'X-Profile': 'sample'}).headers
+    assert client.get('/api/admin/profiles').status_code == 403
+
+    response = client.get('/ping', headers={'X-Profile': 'sample', 'X-Profile-Token': 'secret'})
+    assert response.headers['X-Profile-File'] in [path.name for path in tmp_path.iterdir()]
+    listing = client.get('/api/admin/profiles', headers={'X-Profile-Token': 'secret'})
+    assert [entry['name'] for entry in listing.get_json()] == [response.headers['X-Profile-File']]
+
+
+def test_sampled_profiling_runs_without_a_token(make_client, tmp_path, monkeypatch):
+    client = make_client(None)
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1)
+
+    response = client.get('/ping')
+
+    assert response.status_code == 200
+    assert len(list(tmp_path.iterdir())) == 1
+    assert 'X-Profile-File' not in response.headers
@@ -0,0 +1,37 @@
+from api.rate_limit import MemoryBucketStore, AdmissionController
+
+
+def test_bucket_allows_capacity_then_asks_client_to_wait():
+    store = MemoryBucketStore()
+
+    assert [store.take("login:1.2.3.4", 2, 1) for _ in range(2)] == [0, 0]
+    assert 0 < store.take("login:1.2.3.4", 2, 1) <= 1
+
+
+def test_bucket_store_drops_the_least_recently_used_bucket():
+    store = MemoryBucketStore(max_buckets=2)
+    store.take("catalog:a", 1, 0.001)
+    store.take("catalog:b", 1, 0.001)
+    store.take("catalog:a", 1, 0.001)  # a is now the most recent (and empty)
+
+    store.take("catalog:c", 1, 0.001)
+
+    assert list(store._buckets) == ["catalog:a", "catalog:c"]
+    assert store.take("catalog:a", 1, 0.001) > 0
+
+
+def test_flood_of_distinct_clients_stays_bounded():
+    store = MemoryBucketStore(max_buckets=1000)
+
+    for client in range(10000):
+        store.take(f"catalog:{client}", 1, 0.001)
+
+    assert len(store._buckets) == 1000
+
+
+def test_admission_keeps_slots_for_priority_routes():
+    admission = AdmissionController(max_concurrent=2, reserved_priority_slots=1, route_limits={})
+
+    assert admission.try_acquire("catalog", False)
+    assert not admission.try_acquire("catalog", False)
+    assert admission.try_acquire("checkout", True)
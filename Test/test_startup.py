@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+# Same budget `python -m api.index --check` enforces; not imported from api.index,
+# which would build the app (and start its workers) inside the test process
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1000"))
+
+# Runs in a fresh interpreter so nothing this test session imported counts towards the budget
+IMPORT_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import api.index
+elapsed_ms = (time.perf_counter() - started) * 1000
+from api import mongo
+print(json.dumps({
+    "importMs": elapsed_ms,
+    "coldStartMs": api.index.app.config["COLD_START_MS"],
+    "clientCreated": mongo.client_created(),
+}))
+"""
+
+
+# Settings that start a background thread which queries Mongo as soon as the app is built
+WORKER_SETTINGS = ("ANALYTICS_REFRESH_SECONDS", "BOOK_INDEX_ENABLED")
+UNREACHABLE_URI = "mongodb://10.255.255.1:27017/"
+
+
+def import_app(**env):
+    base_env = {key: value for key, value in os.environ.items() if key not in WORKER_SETTINGS}
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        cwd=REPO_ROOT,
+        env={**base_env, **env},
+        capture_output=True,
+        text=True,
+        timeout=60,
+        check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_importing_the_app_stays_within_the_cold_start_budget():
+    startup = import_app()
+
+    assert startup["importMs"] < IMPORT_BUDGET_MS
+    assert startup["coldStartMs"] < IMPORT_BUDGET_MS
+
+
+def test_default_import_does_not_wait_for_an_unreachable_server():
+    # An unreachable server stalls a connection attempt instead of failing it. With the
+    # default settings the book index and analytics threads start querying straight away,
+    # so a client may already exist, but only those threads may wait on it.
+    startup = import_app(MONGO_URI=UNREACHABLE_URI)
+
+    assert startup["importMs"] < IMPORT_BUDGET_MS
+
+
+def test_building_the_app_without_workers_does_not_create_a_mongo_client():
+    # Turning the analytics refresh and book index threads off leaves nothing that queries
+    # at startup, so any client created here would come from import or create_app itself
+    startup = import_app(MONGO_URI=UNREACHABLE_URI, ANALYTICS_REFRESH_SECONDS="0", BOOK_INDEX_ENABLED="0")
+
+    assert startup["clientCreated"] is False
+    assert startup["importMs"] < IMPORT_BUDGET_MS
+
+
+@pytest.mark.parametrize("command", [["-m", "api.index"], [str(Path("api") / "index.py")]])
+def test_check_mode_passes_without_connecting(command):
+    result = subprocess.run(
+        [sys.executable, *command, "--check"],
+        cwd=REPO_ROOT,
+        env={**os.environ, "MONGO_URI": UNREACHABLE_URI},
+        capture_output=True,
+        text=True,
+        timeout=60
+    )
+
+    assert result.returncode == 0, result.stdout
+    assert "MongoDB client created: False" in result.stdout
@@ -0,0 +1,375 @@
+from flask import Blueprint, jsonify, request
+from flask_cors import cross_origin
+from .mongo import get_collection
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+import argparse
+import hmac
+import os
+import threading
+import time
+import uuid
+
+analytics_bp = Blueprint('analytics', __name__)
+
+# MongoDB connection
+orders_collection = get_collection("orders")
+books_collection = get_collection("books")
+
+# Materialized summary collections - reports read these, never the raw orders
+book_sales_summary = get_collection("book_sales_summary")
+daily_revenue_summary = get_collection("daily_revenue_summary")
+low_stock_summary = get_collection("low_stock_summary")
+analytics_state = get_collection("analytics_state")
+
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "5"))
+REFRESH_INTERVAL_SECONDS = int(os.getenv("ANALYTICS_REFRESH_SECONDS", "300"))
+REFRESH_DEBOUNCE_SECONDS = float(os.getenv("ANALYTICS_DEBOUNCE_SECONDS", "2"))
+# Orders are only folded in once their insert is this old, see _claim_order_window
+SETTLE_SECONDS = int(os.getenv("ANALYTICS_SETTLE_SECONDS", "60"))
+# Store-wide sales figures are back-office only: requests must send this as X-Analytics-Token.
+# When unset the report routes are disabled.
+ANALYTICS_TOKEN = os.getenv("ANALYTICS_TOKEN")
+
+_refresh_requested = threading.Event()
+_refresh_lock = threading.Lock()
+_pending_lock = threading.Lock()
+_pending_book_ids = set()
+_worker_started = False
+
+
+def _claim_order_window(summary):
+    """Return the [low, high) order _id window to fold into one summary collection.
+
+    Windows are cut on the ObjectId _id, which the driver generates when the
+    insert is sent - not on OrderID, which is allocated earlier, so a lower
+    OrderID can land after a higher one. high trails the clock by
+    ANALYTICS_SETTLE_SECONDS so inserts still in flight (or stamped by a
+    host with a slightly slow clock) fall into a later window.
+
+    Each summary keeps its own watermark in analytics_state. The window is
+    recorded as PendingThrough before it is merged and only cleared once the
+    merge succeeds, so a failed or interrupted merge is retried with exactly
+    the same window - the per-document AppliedThrough guard then makes the
+    retry a no-op for documents the first attempt already updated.
+    """
+    state = analytics_state.find_one({"_id": summary}) or {}
+    low = state.get("AppliedThrough")
+    if state.get("PendingThrough") is not None:
+        return low, state["PendingThrough"]
+
+    high = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=SETTLE_SECONDS))
+    if low is not None and low >= high:
+        return None
+    if not orders_collection.find_one(_window_query(low, high), projection={"_id": 1}):
+        return None
+
+    try:
+        analytics_state.update_one(
+            {"_id": summary, "AppliedThrough": low, "PendingThrough": None},
+            {"$set": {"PendingThrough": high}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The watermark moved under us - the upsert collided with the existing state
+        print(f"Analytics window for {summary} already claimed by another worker", flush=True)
+        return None
+
+    return low, high
+
+
+def _window_query(low, high):
+    window = {"$lt": high}
+    if low is not None:
+        window["$gte"] = low
+    return {"_id": window}
+
+
+def _complete_order_window(summary, low, high):
+    analytics_state.update_one(
+        {"_id": summary, "AppliedThrough": low, "PendingThrough": high},
+        {"$set": {"AppliedThrough": high}, "$unset": {"PendingThrough": ""}}
+    )
+
+
+def _add_unless_applied(field):
+    """$merge expression adding the new value only if this window has not been applied yet"""
+    return {"$cond": [
+        # A missing AppliedThrough (null) sorts below every ObjectId
+        {"$lt": ["$AppliedThrough", "$$new.AppliedThrough"]},
+        {"$add": ["$" + field, "$$new." + field]},
+        "$" + field
+    ]}
+
+
+def _merge_book_sales(window, high):
+    """Fold per-book units sold for the given orders into book_sales_summary"""
+    orders_collection.aggregate([
+        {"$match": window},
+        {"$project": {"lines": {"$objectToArray": "$BookIDQuantity"}}},
+        {"$unwind": "$lines"},
+        {"$group": {
+            "_id": {"$toInt": "$lines.k"},
+            "UnitsSold": {"$sum": "$lines.v"},
+            "OrderCount": {"$sum": 1}
+        }},
+        {"$lookup": {
+            "from": "books",
+            "localField": "_id",
+            "foreignField": "BookID",
+            "as": "book"
+        }},
+        {"$project": {
+            "UnitsSold": 1,
+            "OrderCount": 1,
+            "BookTitle": {"$first": "$book.BookTitle"},
+            "AuthorName": {"$first": "$book.AuthorName"},
+            "AppliedThrough": {"$literal": high}
+        }},
+        {"$merge": {
+            "into": "book_sales_summary",
+            "on": "_id",
+            "whenMatched": [{"$set": {
+                "UnitsSold": _add_unless_applied("UnitsSold"),
+                "OrderCount": _add_unless_applied("OrderCount"),
+                "BookTitle": {"$ifNull": ["$$new.BookTitle", "$BookTitle"]},
+                "AuthorName": {"$ifNull": ["$$new.AuthorName", "$AuthorName"]},
+                "AppliedThrough": {"$max": ["$AppliedThrough", "$$new.AppliedThrough"]}
+            }}],
+            "whenNotMatched": "insert"
+        }}
+    ])
+
+
+def _merge_daily_revenue(window, high):
+    """Fold revenue, order and unit counts per calendar day into daily_revenue_summary"""
+    orders_collection.aggregate([
+        {"$match": window},
+        {"$project": {
+            # OrderDate is a BSON date in "date" storage mode, an ISO string otherwise;
+            # both are UTC, so the string's first 10 characters are the same UTC day
+            "day": {"$cond": [
+                {"$eq": [{"$type": "$OrderDate"}, "date"]},
+                {"$dateToString": {"format": "%Y-%m-%d", "date": "$OrderDate"}},
+                {"$substrBytes": ["$OrderDate", 0, 10]}
+            ]},
+            "OrderPrice": 1,
+            "units": {"$reduce": {
+                "input": {"$objectToArray": "$BookIDQuantity"},
+                "initialValue": 0,
+                "in": {"$add": ["$$value", "$$this.v"]}
+            }}
+        }},
+        {"$group": {
+            "_id": "$day",
+            "Revenue": {"$sum": "$OrderPrice"},
+            "OrderCount": {"$sum": 1},
+            "UnitsSold": {"$sum": "$units"}
+        }},
+        {"$set": {"AppliedThrough": {"$literal": high}}},
+        {"$merge": {
+            "into": "daily_revenue_summary",
+            "on": "_id",
+            "whenMatched": [{"$set": {
+                "Revenue": {"$round": [_add_unless_applied("Revenue"), 2]},
+                "OrderCount": _add_unless_applied("OrderCount"),
+                "UnitsSold": _add_unless_applied("UnitsSold"),
+                "AppliedThrough": {"$max": ["$AppliedThrough", "$$new.AppliedThrough"]}
+            }}],
+            "whenNotMatched": "insert"
+        }}
+    ])
+
+
+# Summary collection -> merge function folding an OrderID window into it
+SALES_SUMMARIES = {
+    "book_sales_summary": _merge_book_sales,
+    "daily_revenue_summary": _merge_daily_revenue,
+}
+
+
+def refresh_sales_summaries():
+    """Incrementally fold orders placed since the last refresh into the sales summaries"""
+    orders_folded = 0
+    for summary, merge in SALES_SUMMARIES.items():
+        window_bounds = _claim_order_window(summary)
+        if not window_bounds:
+            continue
+
+        low, high = window_bounds
+        window = _window_query(low, high)
+        # A failure leaves the window pending, so the next refresh redoes exactly this window
+        merge(window, high)
+        _complete_order_window(summary, low, high)
+        folded = orders_collection.count_documents(window)
+        print(f"Analytics {summary} refreshed with {folded} orders inserted before {high.generation_time}", flush=True)
+        orders_folded = max(orders_folded, folded)
+
+    return orders_folded
+
+
+def refresh_low_stock(book_ids=None):
+    """Rebuild low_stock_summary, either fully or only for the given books"""
+    refresh_id = uuid.uuid4().hex
+
+    if book_ids is None:
+        match = {"BookQuantity": {"$lte": LOW_STOCK_THRESHOLD}}
+    else:
+        match = {"BookID": {"$in": list(book_ids)}}
+
+    books_collection.aggregate([
+        {"$match": match},
+        {"$project": {
+            "_id": "$BookID",
+            "BookTitle": 1,
+            "AuthorName": 1,
+            "BookQuantity": 1,
+            "LowStock": {"$lte": ["$BookQuantity", LOW_STOCK_THRESHOLD]},
+            "RefreshID": refresh_id
+        }},
+        {"$merge": {
+            "into": "low_stock_summary",
+            "on": "_id",
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ])
+
+    if book_ids is None:
+        # Anything not touched by this full rebuild is no longer low on stock
+        low_stock_summary.delete_many({"RefreshID": {"$ne": refresh_id}})
+    else:
+        low_stock_summary.delete_many({"_id": {"$in": list(book_ids)}, "LowStock": False})
+
+
+def run_refresh(full=False):
+    """Refresh every summary collection; only one refresh runs per process at a time"""
+    with _refresh_lock:
+        with _pending_lock:
+            book_ids = set(_pending_book_ids)
+            _pending_book_ids.clear()
+
+        orders_folded = refresh_sales_summaries()
+        if full:
+            refresh_low_stock()
+        elif book_ids:
+            refresh_low_stock(book_ids)
+
+        return {'ordersFolded': orders_folded, 'booksChecked': None if full else len(book_ids)}
+
+
+def notify_order_created(book_ids):
+    """Called on order insert - wakes the refresh worker instead of refreshing inline"""
+    with _pending_lock:
+        _pending_book_ids.update(book_ids)
+    _refresh_requested.set()
+
+
+def _refresh_worker():
+    full_refresh_due = time.monotonic()
+    while True:
+        woke_early = _refresh_requested.wait(timeout=REFRESH_INTERVAL_SECONDS)
+        if woke_early:
+            # Let a burst of orders accumulate so they are folded in one pass
+            time.sleep(REFRESH_DEBOUNCE_SECONDS)
+        _refresh_requested.clear()
+
+        full = time.monotonic() >= full_refresh_due
+        try:
+            run_refresh(full=full)
+            if full:
+                full_refresh_due = time.monotonic() + REFRESH_INTERVAL_SECONDS
+        except Exception as e:
+            print(f"=== ERROR refreshing analytics: {e} ===", flush=True)
+
+
+def start_refresh_worker():
+    """Start the background thread that keeps the summary collections up to date"""
+    global _worker_started
+    if _worker_started or REFRESH_INTERVAL_SECONDS <= 0:
+        return
+    _worker_started = True
+    threading.Thread(target=_refresh_worker, name="analytics-refresh", daemon=True).start()
+    print(f"Analytics refresh worker started (every {REFRESH_INTERVAL_SECONDS}s)", flush=True)
+
+
+def back_office_only(view):
+    """Reject requests without the analytics token; customer sessions are not enough"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = request.headers.get('X-Analytics-Token', '')
+        if not ANALYTICS_TOKEN or not hmac.compare_digest(token, ANALYTICS_TOKEN):
+            return jsonify({'error': 'Unauthorized'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@analytics_bp.route('/top-sellers')
+@cross_origin(origins=['http://localhost:3000'], supports_credentials=True)
+@back_office_only
+def get_top_sellers():
+    """Best selling books by units sold"""
+    try:
+        limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+        top_sellers = list(book_sales_summary.find({}).sort("UnitsSold", -1).limit(limit))
+        for entry in top_sellers:
+            entry['BookID'] = entry.pop('_id')
+
+        return jsonify(top_sellers)
+
+    except Exception as e:
+        print(f"=== ERROR in get_top_sellers: {e} ===", flush=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@analytics_bp.route('/revenue-by-day')
+@cross_origin(origins=['http://localhost:3000'], supports_credentials=True)
+@back_office_only
+def get_revenue_by_day():
+    """Revenue, order count and units sold per day, newest first"""
+    try:
+        days = max(1, min(request.args.get('days', 30, type=int), 366))
+        revenue = list(daily_revenue_summary.find({}).sort("_id", -1).limit(days))
+        for entry in revenue:
+            entry['Date'] = entry.pop('_id')
+
+        return jsonify(revenue)
+
+    except Exception as e:
+        print(f"=== ERROR in get_revenue_by_day: {e} ===", flush=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@analytics_bp.route('/low-stock')
+@cross_origin(origins=['http://localhost:3000'], supports_credentials=True)
+@back_office_only
+def get_low_stock():
+    """Books at or below the low stock threshold"""
+    try:
+        limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+        low_stock = list(low_stock_summary.find({}, {"RefreshID": 0}).sort("BookQuantity", 1).limit(limit))
+        for entry in low_stock:
+            entry['BookID'] = entry.pop('_id')
+
+        return jsonify({'threshold': LOW_STOCK_THRESHOLD, 'books': low_stock})
+
+    except Exception as e:
+        print(f"=== ERROR in get_low_stock: {e} ===", flush=True)
+        return jsonify({'error': str(e)}), 500
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analytics summary maintenance")
+    commands = parser.add_subparsers(dest='command', required=True)
+    refresh = commands.add_parser('refresh', help="fold new orders into the summaries")
+    refresh.add_argument('--full', action='store_true', help="also rebuild low_stock_summary for every book")
+    args = parser.parse_args()
+
+    if args.command == 'refresh':
+        print(run_refresh(full=args.full), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,10 @@
 from flask import Blueprint, request, jsonify, session
-from pymongo import MongoClient
-import os
+from ..mongo import get_collection
 
 auth_bp = Blueprint('auth', __name__)
 
 # MongoDB connection - Fixed the URI format
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-client = MongoClient(MONGO_URI)
-db = client["bookstore"]
-customers = db["customers"]
+customers = get_collection("customers")
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
@@ -0,0 +1,221 @@
+from .mongo import get_collection
+from pymongo.errors import PyMongoError, OperationFailure
+from array import array
+from bisect import bisect_left
+import os
+import threading
+import time
+
+# MongoDB connection
+books_collection = get_collection("books")
+
+BOOK_INDEX_ENABLED = os.getenv("BOOK_INDEX_ENABLED", "1") == "1"
+# Full reload interval, used when change streams are unavailable (standalone server)
+REFRESH_INTERVAL_SECONDS = int(os.getenv("BOOK_INDEX_REFRESH_SECONDS", "300"))
+# Fold the overlay back into the arrays once this many books have changed
+MAX_OVERLAY_SIZE = int(os.getenv("BOOK_INDEX_MAX_OVERLAY", "10000"))
+LOAD_BATCH_SIZE = 5000
+# BookIDs and prices in cents are stored in signed 32-bit array columns
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def is_book_id(value):
+    """BookIDs are ints; bools and strings like "2" never match a book"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _index_row(book):
+    """(BookID, price in cents, title) for a book document, or None if it can't be indexed"""
+    book_id, price = book.get('BookID'), book.get('BookPrice')
+    if not is_book_id(book_id) or not isinstance(price, (int, float)) or isinstance(price, bool):
+        return None
+    try:
+        price_cents = round(price * 100)
+    except (ValueError, OverflowError):  # NaN or infinity
+        return None
+    if not (INT32_MIN <= book_id <= INT32_MAX and INT32_MIN <= price_cents <= INT32_MAX):
+        return None
+    title = book.get('BookTitle')
+    return book_id, price_cents, title if isinstance(title, str) else ''
+
+
+class _Snapshot:
+    """Immutable column arrays for every book, sorted by BookID.
+
+    Prices are stored as integer cents and titles as one UTF-8 blob with an
+    offsets column, so a 1M book catalog costs ~12 bytes per book plus the
+    title text instead of a dict and several objects per book.
+    """
+    __slots__ = ('book_ids', 'price_cents', 'title_offsets', 'titles')
+
+    def __init__(self, book_ids, price_cents, title_offsets, titles):
+        self.book_ids = book_ids
+        self.price_cents = price_cents
+        self.title_offsets = title_offsets
+        self.titles = titles
+
+    @classmethod
+    def empty(cls):
+        return cls(array('i'), array('i'), array('I', [0]), b'')
+
+    def lookup(self, book_id):
+        if not is_book_id(book_id):
+            return None
+        position = bisect_left(self.book_ids, book_id)
+        if position == len(self.book_ids) or self.book_ids[position] != book_id:
+            return None
+        start, end = self.title_offsets[position], self.title_offsets[position + 1]
+        return self.price_cents[position] / 100, self.titles[start:end].decode('utf-8')
+
+    def memory_bytes(self):
+        return sum(column.itemsize * len(column) for column in
+                   (self.book_ids, self.price_cents, self.title_offsets)) + len(self.titles)
+
+
+class BookIndex:
+    """Read-mostly BookID -> (price, title) lookup for cart validation.
+
+    Loaded in the background at startup and kept fresh from a change stream
+    (or periodic reloads). Stock is deliberately not cached - it stays
+    authoritative in Mongo.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._snapshot = _Snapshot.empty()
+        self._overlay = {}  # BookID -> (price, title) for books changed since the last load
+        self._lock = threading.Lock()
+        self._reload_requested = threading.Event()
+        self.loaded = False
+        self.loaded_at = None
+        self._started = False
+
+    def lookup(self, book_id):
+        """Return (price, title) or None if the book is not in the index"""
+        if not is_book_id(book_id):
+            return None
+        overlay = self._overlay
+        if overlay and book_id in overlay:
+            return overlay[book_id]
+        return self._snapshot.lookup(book_id)
+
+    def reload(self):
+        """Rebuild the column arrays from Mongo and swap them in"""
+        started = time.time()
+        book_ids, price_cents, title_offsets = array('i'), array('i'), array('I', [0])
+        titles = bytearray()
+
+        cursor = self.collection.find(
+            {}, {"_id": 0, "BookID": 1, "BookPrice": 1, "BookTitle": 1}
+        ).sort("BookID", 1).batch_size(LOAD_BATCH_SIZE)
+
+        skipped = []
+        for book in cursor:
+            row = _index_row(book)
+            if row is None:
+                skipped.append(book.get('BookID'))
+                continue
+            book_ids.append(row[0])
+            price_cents.append(row[1])
+            titles += row[2].encode('utf-8')
+            title_offsets.append(len(titles))
+        if skipped:
+            print(f"Book index skipped {len(skipped)} books with a missing or invalid BookID/BookPrice "
+                  f"(BookIDs {skipped[:10]!r})", flush=True)
+
+        snapshot = _Snapshot(book_ids, price_cents, title_offsets, bytes(titles))
+        with self._lock:
+            self._snapshot = snapshot
+            self._overlay = {}
+        self.loaded = True
+        self.loaded_at = time.time()
+        print(f"Book index loaded {len(book_ids)} books "
+              f"({snapshot.memory_bytes() / 1024 / 1024:.1f} MB) in {time.time() - started:.2f}s", flush=True)
+
+    def _apply_change(self, change):
+        operation = change['operationType']
+        if operation == 'delete' or operation == 'invalidate':
+            # Deletes only carry the _id, so rebuild rather than keep an _id map around
+            self._reload_requested.set()
+            return
+
+        book = change.get('fullDocument') or {}
+        row = _index_row(book)
+        if row is None and not is_book_id(book.get('BookID')):
+            return
+
+        with self._lock:
+            # Copy-on-write so lookups never see a dict being resized
+            overlay = dict(self._overlay)
+            # A book whose price became invalid is dropped rather than kept at its old price
+            overlay[book['BookID']] = (row[1] / 100, row[2]) if row else None
+            self._overlay = overlay
+        if len(overlay) > MAX_OVERLAY_SIZE:
+            self._reload_requested.set()
+
+    def _watch_changes(self):
+        """Follow price/title changes; stock-only updates are filtered out on the server"""
+        pipeline = [{"$match": {"$or": [
+            {"operationType": {"$in": ["insert", "replace", "delete", "invalidate"]}},
+            {"updateDescription.updatedFields.BookPrice": {"$exists": True}},
+            {"updateDescription.updatedFields.BookTitle": {"$exists": True}},
+            {"updateDescription.updatedFields.BookID": {"$exists": True}}
+        ]}}]
+        with self.collection.watch(pipeline, full_document='updateLookup') as stream:
+            # Load only once the stream is open so no change slips in between
+            self.reload()
+            while stream.alive:
+                change = stream.try_next()
+                if change is not None:
+                    self._apply_change(change)
+                elif self._reload_requested.is_set():
+                    self._reload_requested.clear()
+                    self.reload()
+                else:
+                    time.sleep(0.5)
+
+    def _run(self):
+        while True:
+            try:
+                self._watch_changes()
+            except OperationFailure as e:
+                # Change streams need a replica set - fall back to periodic full reloads
+                print(f"Book index change stream unavailable ({e}), reloading every "
+                      f"{REFRESH_INTERVAL_SECONDS}s", flush=True)
+                self._reload_periodically()
+            except PyMongoError as e:
+                print(f"=== ERROR loading book index: {e} ===", flush=True)
+                time.sleep(min(REFRESH_INTERVAL_SECONDS, 30))
+            except Exception as e:
+                # Anything else would end the thread and leave the index stale for good, so retry
+                print(f"=== UNEXPECTED ERROR in book index: {e!r} ===", flush=True)
+                time.sleep(min(REFRESH_INTERVAL_SECONDS, 30))
+
+    def _reload_periodically(self):
+        while True:
+            try:
+                self.reload()
+            except PyMongoError as e:
+                print(f"=== ERROR reloading book index: {e} ===", flush=True)
+            self._reload_requested.wait(timeout=REFRESH_INTERVAL_SECONDS)
+            self._reload_requested.clear()
+
+    def start(self):
+        """Load the index and keep it fresh in a background thread"""
+        if self._started or not BOOK_INDEX_ENABLED:
+            return
+        self._started = True
+        threading.Thread(target=self._run, name="book-index", daemon=True).start()
+
+    def stats(self):
+        return {
+            'enabled': BOOK_INDEX_ENABLED,
+            'loaded': self.loaded,
+            'books': len(self._snapshot.book_ids),
+            'pendingChanges': len(self._overlay),
+            'memoryBytes': self._snapshot.memory_bytes(),
+            'loadedAt': self.loaded_at
+        }
+
+
+book_index = BookIndex(books_collection)
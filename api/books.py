@@ -1,14 +1,15 @@
 from flask import Blueprint, jsonify
-from pymongo import MongoClient
-import os
+from .mongo import get_collection, get_client
+from .read_routing import for_route
+from .book_index import book_index
 
 books_bp = Blueprint('books', __name__)
 
 # MongoDB connection
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-client = MongoClient(MONGO_URI)
-db = client["bookstore"]
-books_collection = db["books"]
+books_collection = get_collection("books")
+
+# Catalog reads can be served by secondaries (see read_routing.py)
+catalog_books = for_route(books_collection, "catalog")
 
 # Enable CORS for direct connections
 from flask_cors import cross_origin
@@ -23,7 +24,7 @@ def get_all_books():
         
         # Get more books now that direct connection works well
         # Start with 200 books - can increase more if needed
-        books = list(books_collection.find({}).sort("BookID", 1).limit(200))
+        books = list(catalog_books.find({}).sort("BookID", 1).limit(200))
         print(f"Fetched {len(books)} books from database", flush=True)
         
         # Clean up and validate books
@@ -88,12 +89,13 @@ def debug_books():
     """Debug endpoint"""
     try:
         # Test MongoDB connection
-        client.admin.command('ping')
+        get_client().admin.command('ping')
         book_count = books_collection.count_documents({})
         
         return jsonify({
             'mongodb_connected': True,
             'books_count': book_count,
+            'book_index': book_index.stats(),
             'status': 'debug working'
         })
         
@@ -0,0 +1,94 @@
+from .mongo import get_collection
+from .book_index import book_index, is_book_id
+
+# MongoDB connection
+books_collection = get_collection("books")
+
+# Line status -> HTTP status create_order answers with when that line fails
+LINE_ERROR_STATUS = {
+    'invalid': 400,
+    'not_found': 404,
+    'insufficient_stock': 400,
+}
+
+
+def quote_cart(books_data):
+    """Validate and price a cart without writing anything.
+
+    books_data is the order payload: [{'bookID': 1, 'quantity': 2}, ...].
+    Prices and titles come from the in-memory book index; stock is read from
+    Mongo for the whole cart in a single query. Returns per-line availability,
+    the cart totals and the BookIDQuantity map an order would store.
+    """
+    lines = []
+    requested = {}  # BookID -> total quantity across the cart
+
+    for book_item in books_data:
+        book_id = book_item.get('bookID')
+        quantity = book_item.get('quantity')
+        line = {'bookID': book_id, 'quantity': quantity}
+
+        if not is_book_id(book_id) or not isinstance(quantity, int) or quantity <= 0:
+            line.update(status='invalid', error=f'Invalid book or quantity: {book_item}')
+        else:
+            requested[book_id] = requested.get(book_id, 0) + quantity
+        lines.append(line)
+
+    catalog_entries = {book_id: book_index.lookup(book_id) for book_id in requested}
+    stock_projection = {"_id": 0, "BookID": 1, "BookQuantity": 1}
+    if None in catalog_entries.values():
+        # Books the index has not seen yet (e.g. still loading) are priced from Mongo
+        stock_projection.update({"BookPrice": 1, "BookTitle": 1})
+    stock = {
+        book['BookID']: book for book in
+        books_collection.find({"BookID": {"$in": list(requested)}}, stock_projection)
+    } if requested else {}
+
+    total_price = 0
+    total_items = 0
+    for line in lines:
+        if line.get('status') == 'invalid':
+            continue
+
+        book_id, quantity = line['bookID'], line['quantity']
+        book = stock.get(book_id)
+        if not book:
+            line.update(status='not_found', error=f'Book with ID {book_id} not found')
+            continue
+
+        book_price, book_title = catalog_entries[book_id] or (book['BookPrice'], book['BookTitle'])
+        line.update(
+            BookTitle=book_title,
+            unitPrice=book_price,
+            lineTotal=round(book_price * quantity, 2),
+            available=book['BookQuantity']
+        )
+
+        if book['BookQuantity'] < requested[book_id]:
+            line.update(
+                status='insufficient_stock',
+                error=f'Insufficient stock for "{book_title}". Available: {book["BookQuantity"]}, Requested: {requested[book_id]}'
+            )
+            continue
+
+        line['status'] = 'ok'
+        total_price += book_price * quantity
+        total_items += quantity
+
+    errors = [line['error'] for line in lines if line['status'] != 'ok']
+    return {
+        'valid': not errors,
+        'lines': lines,
+        'errors': errors,
+        'totalItems': total_items,
+        'totalPrice': round(total_price, 2),
+        'bookIDQuantity': {str(book_id): quantity for book_id, quantity in requested.items()}
+    }
+
+
+def first_error(quote):
+    """Return (message, http_status) for the first failing line of a quote, or None"""
+    for line in quote['lines']:
+        if line['status'] != 'ok':
+            return line['error'], LINE_ERROR_STATUS[line['status']]
+    return None
@@ -0,0 +1,141 @@
+from flask import request, session, jsonify, make_response
+from .mongo import get_collection
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from datetime import datetime, timedelta
+from functools import wraps
+import hashlib
+import os
+import time
+
+# MongoDB connection
+idempotency_keys = get_collection("idempotency_keys")
+
+# How long a key and its stored response are remembered
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# How long a duplicate waits for the first attempt before giving up with 409
+WAIT_TIMEOUT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+# An in-progress attempt older than this is presumed dead and may be taken over
+LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "60"))
+POLL_INTERVAL_SECONDS = 0.1
+
+_indexes_ensured = False
+
+
+def ensure_idempotency_indexes():
+    global _indexes_ensured
+    if _indexes_ensured:
+        return
+    idempotency_keys.create_index([("CustomerID", 1), ("Key", 1)], unique=True)
+    idempotency_keys.create_index("CreatedAt", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+    _indexes_ensured = True
+
+
+def _replay(record):
+    response = make_response(record['Body'], record['StatusCode'])
+    response.headers['Content-Type'] = record['ContentType']
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(key, customer_id, fingerprint):
+    """Claim the key for this attempt.
+
+    Returns (True, None) when this request should do the work, or
+    (False, response) when it must answer with a stored or error response.
+    Duplicates poll until the first attempt finishes or the wait times out.
+    """
+    deadline = time.monotonic() + WAIT_TIMEOUT_SECONDS
+    while True:
+        now = datetime.utcnow()
+        try:
+            idempotency_keys.insert_one({
+                "Key": key,
+                "CustomerID": customer_id,
+                "Fingerprint": fingerprint,
+                "Status": "in_progress",
+                "CreatedAt": now,
+                "LockedUntil": now + timedelta(seconds=LEASE_SECONDS)
+            })
+            return True, None
+        except DuplicateKeyError:
+            pass
+
+        record = idempotency_keys.find_one({"CustomerID": customer_id, "Key": key})
+        if record is None:
+            # The first attempt failed and released the key - try to take it
+            continue
+
+        if record['Fingerprint'] != fingerprint:
+            return False, (jsonify({'error': 'Idempotency-Key was already used with a different request'}), 422)
+
+        if record['Status'] == 'completed':
+            print(f"Replaying stored response for Idempotency-Key {key}", flush=True)
+            return False, _replay(record)
+
+        if record['LockedUntil'] < now:
+            # The first attempt died mid-flight; take over its lease
+            taken = idempotency_keys.update_one(
+                {"_id": record['_id'], "Status": "in_progress", "LockedUntil": record['LockedUntil']},
+                {"$set": {"LockedUntil": now + timedelta(seconds=LEASE_SECONDS)}}
+            )
+            if taken.modified_count:
+                return True, None
+            continue
+
+        if time.monotonic() >= deadline:
+            response = jsonify({'error': 'A request with this Idempotency-Key is still being processed'})
+            response.status_code = 409
+            response.headers['Retry-After'] = '1'
+            return False, response
+
+        time.sleep(POLL_INTERVAL_SECONDS)
+
+
+def idempotent(view):
+    """Honour an Idempotency-Key header on a view.
+
+    The first request with a key runs the view and stores its response; later
+    requests with the same key (per customer) get that response back without
+    repeating any work. Only successful responses are stored: errors (4xx
+    like insufficient stock as well as 5xx) did no work, so they release the
+    key and a retry with the same key is evaluated afresh.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        current_user = session.get('currentUser')
+        if not key or not current_user:
+            # Without a key (or a session, which the view rejects anyway) nothing to dedupe
+            return view(*args, **kwargs)
+
+        customer_id = current_user['CustomerID']
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        try:
+            ensure_idempotency_indexes()
+            owner, response = _claim(key, customer_id, fingerprint)
+        except PyMongoError as e:
+            print(f"=== ERROR checking Idempotency-Key: {e} ===", flush=True)
+            return jsonify({'error': 'Could not verify Idempotency-Key, please retry'}), 503
+        if not owner:
+            return response
+
+        record = {"CustomerID": customer_id, "Key": key}
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            idempotency_keys.delete_one(record)
+            raise
+
+        if not 200 <= response.status_code < 300:
+            idempotency_keys.delete_one(record)
+        else:
+            idempotency_keys.update_one(record, {"$set": {
+                "Status": "completed",
+                "StatusCode": response.status_code,
+                "Body": response.get_data(as_text=True),
+                "ContentType": response.headers.get('Content-Type', 'application/json'),
+                "CompletedAt": datetime.utcnow()
+            }})
+        return response
+
+    return wrapper
@@ -1,92 +1,217 @@
+import time
+
+# Cold start is measured from the first line of the app module
+_import_started = time.perf_counter()
+
 from flask import Flask, session, jsonify
 from flask_cors import CORS
-import sys
+import argparse
 import os
+import sys
+
+if __name__ == '__main__' and not __package__:
+    # `python api/index.py`: rerun as `python -m api.index` so the package imports below resolve
+    import runpy
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    runpy.run_module('api.index', run_name='__main__', alter_sys=True)
+    sys.exit()
+
+from . import mongo
+
+DEFAULT_SECRET_KEY = 'your_secret_key_change_in_production'
+# --check and Test/test_startup.py fail when importing and building the app takes longer than this
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1000"))
+
+
+def create_app(start_workers=True):
+    """Build the Flask app.
+
+    Nothing here talks to Mongo: the shared client is created on the first
+    query, so a freshly scaled worker can take requests straight away.
+    start_workers=False skips the background threads (used by --check).
+    """
+    from .auth.login import auth_bp
+    from .orders import orders_bp
+    from .books import books_bp
+    from .analytics import analytics_bp, start_refresh_worker
+    from .order_queue import start_queue_workers
+    from .rate_limit import init_rate_limiting
+    from .book_index import book_index
+    from .profiling import init_profiling
+
+    app = Flask(__name__)
+    app.secret_key = os.getenv("FLASK_SECRET_KEY", DEFAULT_SECRET_KEY)  # Set FLASK_SECRET_KEY in production
+
+    # Configure CORS - allow direct connections from frontend
+    CORS(app,
+         supports_credentials=True,
+         origins=["http://localhost:3000", "http://127.0.0.1:3000"],
+         methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+         allow_headers=["Content-Type", "Authorization", "Access-Control-Allow-Origin", "Idempotency-Key"],
+         expose_headers=["Content-Type", "Retry-After", "Idempotent-Replayed"],
+         max_age=86400)
+
+    # Per-client token buckets and admission control (429/503 with Retry-After)
+    init_rate_limiting(app)
+
+    # Opt-in per-request profiling (PROFILING_ENABLED=1), off by default with no overhead
+    init_profiling(app)
 
-# Add the parent directory to the path so we can import from api/
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
-from auth.login import auth_bp
-from orders import orders_bp
-from books import books_bp
-
-# Create Flask app
-app = Flask(__name__)
-app.secret_key = 'your_secret_key_change_in_production'  # Change this to a secure key in production
-
-# Configure CORS - allow direct connections from frontend
-CORS(app, 
-     supports_credentials=True, 
-     origins=["http://localhost:3000", "http://127.0.0.1:3000"],
-     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-     allow_headers=["Content-Type", "Authorization", "Access-Control-Allow-Origin"],
-     expose_headers=["Content-Type"],
-     max_age=86400)
-
-# Register blueprints without proxy complications
-print("Registering blueprints...")
-try:
     app.register_blueprint(auth_bp, url_prefix='/api/auth', strict_slashes=False)
     app.register_blueprint(orders_bp, url_prefix='/api/orders', strict_slashes=False)
     app.register_blueprint(books_bp, url_prefix='/api/books', strict_slashes=False)
-    print("Blueprints registered successfully!")
-except Exception as e:
-    print(f"Error registering blueprints: {e}")
-
-# Get current user session
-@app.route('/api/auth/session')
-def get_session():
-    print("Session check requested", flush=True)
-    print("Current session:", dict(session), flush=True)
-    
-    user = session.get('currentUser')
-    if user:
-        print("User found in session:", user, flush=True)
+    app.register_blueprint(analytics_bp, url_prefix='/api/analytics', strict_slashes=False)
+
+    # Get current user session
+    @app.route('/api/auth/session')
+    def get_session():
+        print("Session check requested", flush=True)
+        print("Current session:", dict(session), flush=True)
+
+        user = session.get('currentUser')
+        if user:
+            print("User found in session:", user, flush=True)
+            return jsonify({
+                'user': {
+                    'CustomerID': user['CustomerID'],
+                    'CustomerName': user['CustomerName'],
+                    'CustomerEmail': user['CustomerEmail']
+                }
+            })
+
+        print("No user in session", flush=True)
+        return jsonify({'user': None})
+
+    # Add a test endpoint to check if the API is working
+    @app.route('/api/test')
+    def test_api():
+        print("Test API endpoint called", flush=True)
         return jsonify({
-            'user': {
-                'CustomerID': user['CustomerID'],
-                'CustomerName': user['CustomerName'],
-                'CustomerEmail': user['CustomerEmail']
-            }
+            'status': 'success',
+            'message': 'API is working correctly - direct connection',
+            'port': 5000,
+            'coldStartMs': app.config.get('COLD_START_MS'),
+            'registered_routes': [str(rule) for rule in app.url_map.iter_rules()]
         })
-    
-    print("No user in session", flush=True)
-    return jsonify({'user': None})
-
-# Add a test endpoint to check if the API is working
-@app.route('/api/test')
-def test_api():
-    print("Test API endpoint called", flush=True)
-    return jsonify({
-        'status': 'success',
-        'message': 'API is working correctly - direct connection',
-        'port': 5000,
-        'registered_routes': [str(rule) for rule in app.url_map.iter_rules()]
-    })
-
-# Root endpoint
-@app.route('/')
-def index():
-    return jsonify({
-        'message': 'Bookstore API is running! Direct connections enabled.',
-        'port': 5000,
-        'endpoints': [
-            '/api/test',
-            '/api/auth/session',
-            '/api/auth/login',
-            '/api/auth/logout',
-            '/api/books',
-            '/api/orders/create'
-        ]
-    })
+
+    # Root endpoint
+    @app.route('/')
+    def index():
+        return jsonify({
+            'message': 'Bookstore API is running! Direct connections enabled.',
+            'port': 5000,
+            'endpoints': [
+                '/api/test',
+                '/api/auth/session',
+                '/api/auth/login',
+                '/api/auth/logout',
+                '/api/books',
+                '/api/orders/create',
+                '/api/analytics/top-sellers',
+                '/api/analytics/revenue-by-day',
+                '/api/analytics/low-stock'
+            ]
+        })
+
+    if start_workers:
+        # Keep the materialized analytics summaries up to date in the background
+        start_refresh_worker()
+        # Drain queued orders in the background when ORDER_INGEST_MODE=queued
+        start_queue_workers()
+        # Load the in-memory price/title index used for cart validation
+        book_index.start()
+
+    app.config['COLD_START_MS'] = round((time.perf_counter() - _import_started) * 1000, 1)
+    return app
+
+
+def check_config():
+    """Validate configuration without connecting to anything.
+
+    Returns (errors, warnings) as lists of messages.
+    """
+    from pymongo.uri_parser import parse_uri
+    from .analytics import ANALYTICS_TOKEN
+    from .order_queue import ORDER_INGEST_MODE
+    from .order_storage import ORDER_DATE_STORAGE
+    from .profiling import PROFILING_ENABLED, PROFILE_TOKEN
+    from .rate_limit import RATE_LIMIT_STORE
+    from .read_routing import ROUTE_READ_PREFERENCES, READ_PREFERENCE_MODES
+
+    errors = []
+    warnings = []
+
+    uri = mongo.MONGO_URI
+    if uri.startswith("mongodb+srv://"):
+        # Expanding an SRV record needs a DNS lookup, so only check the URI syntax
+        uri = uri.replace("mongodb+srv://", "mongodb://", 1)
+    try:
+        parse_uri(uri)
+    except Exception as e:
+        errors.append(f"MONGO_URI is invalid: {e}")
+
+    if ORDER_INGEST_MODE not in ("sync", "queued"):
+        errors.append(f"ORDER_INGEST_MODE must be 'sync' or 'queued', got {ORDER_INGEST_MODE!r}")
+    if ORDER_DATE_STORAGE not in ("string", "date"):
+        errors.append(f"ORDER_DATE_STORAGE must be 'string' or 'date', got {ORDER_DATE_STORAGE!r}")
+    if RATE_LIMIT_STORE not in ("memory", "mongo"):
+        errors.append(f"RATE_LIMIT_STORE must be 'memory' or 'mongo', got {RATE_LIMIT_STORE!r}")
+    for route, mode in ROUTE_READ_PREFERENCES.items():
+        if mode != "primary" and mode not in READ_PREFERENCE_MODES:
+            errors.append(f"Read preference for {route} is not a valid mode: {mode!r}")
+
+    if PROFILING_ENABLED and not PROFILE_TOKEN:
+        warnings.append("PROFILE_TOKEN is not set - only sampled profiling runs, X-Profile and /api/admin/profiles are off")
+    if not ANALYTICS_TOKEN:
+        warnings.append("ANALYTICS_TOKEN is not set - the /api/analytics report routes are disabled")
+    if os.getenv("FLASK_SECRET_KEY", DEFAULT_SECRET_KEY) == DEFAULT_SECRET_KEY:
+        warnings.append("FLASK_SECRET_KEY is not set - sessions use the development key")
+
+    return errors, warnings
+
+
+def run_check():
+    """--check: build the app, validate configuration and enforce the import-time budget"""
+    app = create_app(start_workers=False)
+    cold_start_ms = app.config['COLD_START_MS']
+    errors, warnings = check_config()
+
+    if mongo.client_created():
+        errors.append("A MongoClient was created while building the app - startup must not connect")
+    if cold_start_ms > IMPORT_BUDGET_MS:
+        errors.append(f"Cold start took {cold_start_ms} ms, over the {IMPORT_BUDGET_MS:g} ms budget (IMPORT_BUDGET_MS)")
+
+    print(f"Cold start: {cold_start_ms} ms (budget {IMPORT_BUDGET_MS:g} ms)")
+    print(f"Routes registered: {len(list(app.url_map.iter_rules()))}")
+    print(f"MongoDB client created: {mongo.client_created()} (database {mongo.DATABASE_NAME})")
+    for warning in warnings:
+        print(f"WARNING: {warning}")
+    for error in errors:
+        print(f"ERROR: {error}")
+    print("Configuration check failed" if errors else "Configuration OK")
+    return 1 if errors else 0
+
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bookstore API server")
+    parser.add_argument('--check', action='store_true',
+                        help="validate configuration and startup time without connecting to MongoDB")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(run_check())
+
+    app = create_app()
+    print(f"Cold start: {app.config['COLD_START_MS']} ms", flush=True)
     print("Starting Flask server on http://localhost:5000")
     print("Direct connections enabled - no proxy needed!")
     print("Make sure MongoDB is running on localhost:27017")
-    
+
     # Force port 5000
     port = int(os.environ.get('PORT', 5000))
     print(f"Flask server will run on port: {port}")
-    
-    app.run(debug=True, port=port, host='0.0.0.0')  # Allow connections from any IP
\ No newline at end of file
+
+    app.run(debug=True, port=port, host='0.0.0.0')  # Allow connections from any IP
+else:
+    # Module-level app for `flask --app api/index run`
+    app = create_app()
+    print(f"Cold start: {app.config['COLD_START_MS']} ms", flush=True)
@@ -0,0 +1,60 @@
+from pymongo import MongoClient
+import os
+import threading
+
+# MongoDB connection - one client per process, created on first use
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+DATABASE_NAME = os.getenv("MONGO_DB", "bookstore")
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the shared MongoClient, creating it on first use.
+
+    connect=False also defers the server monitors until the first operation,
+    so a worker that never reaches Mongo (or runs --check) never dials it.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(MONGO_URI, connect=False)
+    return _client
+
+
+def client_created():
+    return _client is not None
+
+
+class LazyCollection:
+    """Stands in for a pymongo Collection until it is first used.
+
+    Modules keep their module-level collection names, but importing them
+    no longer creates a client.
+    """
+
+    def __init__(self, name, **options):
+        self._name = name
+        self._options = options
+        self._collection = None
+
+    def with_options(self, **options):
+        return LazyCollection(self._name, **{**self._options, **options})
+
+    def _resolve(self):
+        if self._collection is None:
+            collection = get_client()[DATABASE_NAME][self._name]
+            self._collection = collection.with_options(**self._options) if self._options else collection
+        return self._collection
+
+    def __getattr__(self, attribute):
+        return getattr(self._resolve(), attribute)
+
+    def __repr__(self):
+        return f"LazyCollection({DATABASE_NAME}.{self._name})"
+
+
+def get_collection(name):
+    return LazyCollection(name)
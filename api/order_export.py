@@ -0,0 +1,171 @@
+from .mongo import get_collection
+from collections import OrderedDict
+from .order_storage import format_order_date, orders_archive
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import zlib
+
+# MongoDB connection
+orders_collection = get_collection("orders")
+books_collection = get_collection("books")
+
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 5000
+BOOK_CACHE_SIZE = int(os.getenv("EXPORT_BOOK_CACHE_SIZE", "10000"))
+
+CSV_FIELDS = ["OrderID", "CustomerID", "OrderDate", "OrderPrice",
+              "BookID", "BookTitle", "AuthorName", "BookPrice", "Quantity"]
+
+BOOK_FIELDS = {"_id": 0, "BookID": 1, "BookTitle": 1, "AuthorName": 1, "BookPrice": 1}
+ORDER_FIELDS = {"_id": 0, "OrderID": 1, "CustomerID": 1, "OrderDate": 1, "OrderPrice": 1, "BookIDQuantity": 1}
+
+
+class BookLookupCache:
+    """Bounded LRU of book details so the export never holds the whole catalog"""
+
+    def __init__(self, collection, max_size=BOOK_CACHE_SIZE):
+        self.collection = collection
+        self.max_size = max_size
+        self._books = OrderedDict()
+
+    def get_many(self, book_ids):
+        """Return {BookID: book} for the given ids, fetching misses in one query"""
+        found = {}
+        missing = []
+        for book_id in book_ids:
+            if book_id in self._books:
+                self._books.move_to_end(book_id)
+                found[book_id] = self._books[book_id]
+            else:
+                missing.append(book_id)
+
+        if missing:
+            for book in self.collection.find({"BookID": {"$in": missing}}, BOOK_FIELDS):
+                found[book['BookID']] = book
+                self._books[book['BookID']] = book
+            while len(self._books) > self.max_size:
+                self._books.popitem(last=False)
+
+        return found
+
+
+def iter_order_batches(customer_id=None, batch_size=DEFAULT_BATCH_SIZE, collections=None):
+    """Yield lists of at most batch_size orders in OrderID order, one collection after another.
+
+    Each batch is its own range query on OrderID (served by the
+    (CustomerID, OrderID) index, see order_storage.ensure_order_indexes)
+    instead of one long-lived cursor, so a slow client reading a large
+    export never hits the server's idle cursor or session timeout.
+    """
+    query = {"OrderID": {"$exists": True}}
+    if customer_id is not None:
+        query["CustomerID"] = customer_id
+
+    for collection in collections or [orders_archive, orders_collection]:
+        last_order_id = None
+        while True:
+            batch_query = dict(query)
+            if last_order_id is not None:
+                batch_query["OrderID"] = {"$gt": last_order_id}
+            batch = list(collection.find(batch_query, ORDER_FIELDS).sort("OrderID", 1).limit(batch_size))
+            if not batch:
+                break
+            yield batch
+            if len(batch) < batch_size:
+                break
+            last_order_id = batch[-1]["OrderID"]
+
+
+def _join_books(batch, cache):
+    """Attach book details to every order in the batch with at most one book query"""
+    book_ids = {int(book_id) for order in batch for book_id in order.get('BookIDQuantity', {})}
+    books = cache.get_many(book_ids)
+    for order in batch:
+        order['books'] = []
+        for book_id_str, quantity in order.get('BookIDQuantity', {}).items():
+            book = books.get(int(book_id_str), {})
+            order['books'].append({
+                "BookID": int(book_id_str),
+                "BookTitle": book.get("BookTitle"),
+                "AuthorName": book.get("AuthorName"),
+                "BookPrice": book.get("BookPrice"),
+                "quantity": quantity
+            })
+        order['OrderDate'] = format_order_date(order.get('OrderDate'))
+    return batch
+
+
+def ndjson_chunks(batches, cache):
+    for batch in batches:
+        yield ''.join(json.dumps(order, default=str) + '\n' for order in _join_books(batch, cache)).encode('utf-8')
+
+
+def csv_chunks(batches, cache):
+    """One CSV row per book in each order"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for batch in batches:
+        for order in _join_books(batch, cache):
+            for book in order['books']:
+                writer.writerow({
+                    "OrderID": order.get("OrderID"),
+                    "CustomerID": order.get("CustomerID"),
+                    "OrderDate": order.get("OrderDate"),
+                    "OrderPrice": order.get("OrderPrice"),
+                    "BookID": book["BookID"],
+                    "BookTitle": book["BookTitle"],
+                    "AuthorName": book["AuthorName"],
+                    "BookPrice": book["BookPrice"],
+                    "Quantity": book["quantity"]
+                })
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def gzip_chunks(chunks):
+    """Compress a byte stream on the fly (gzip container, not a whole-file buffer)"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_orders(customer_id=None, export_format='ndjson', compress=False,
+                  batch_size=DEFAULT_BATCH_SIZE, collections=None):
+    """Stream an order export as bytes; memory stays bounded by batch_size and the book cache"""
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    batches = iter_order_batches(customer_id, batch_size, collections)
+    cache = BookLookupCache(books_collection)
+
+    chunks = csv_chunks(batches, cache) if export_format == 'csv' else ndjson_chunks(batches, cache)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export orders as NDJSON or CSV")
+    parser.add_argument('--customer', type=int, help="only export this CustomerID (default: all orders)")
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    parser.add_argument('--gzip', action='store_true', help="gzip the output")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--output', '-o', help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in export_orders(args.customer, args.format, args.gzip, args.batch_size):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+from .mongo import get_collection
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from .analytics import notify_order_created
+from .order_storage import ensure_order_indexes, orders_archive
+
+# MongoDB connection
+orders_collection = get_collection("orders")
+books_collection = get_collection("books")
+order_queue = get_collection("order_queue")
+counters = get_collection("counters")
+
+# "sync" inserts orders inside the request, "queued" hands them to the background workers
+ORDER_INGEST_MODE = os.getenv("ORDER_INGEST_MODE", "sync").lower()
+QUEUE_WORKERS = int(os.getenv("ORDER_QUEUE_WORKERS", "2"))
+QUEUE_BATCH_SIZE = int(os.getenv("ORDER_QUEUE_BATCH_SIZE", "100"))
+QUEUE_POLL_SECONDS = float(os.getenv("ORDER_QUEUE_POLL_SECONDS", "0.5"))
+CLAIM_TIMEOUT_SECONDS = int(os.getenv("ORDER_QUEUE_CLAIM_TIMEOUT", "60"))
+MAX_ATTEMPTS = int(os.getenv("ORDER_QUEUE_MAX_ATTEMPTS", "5"))
+COMPLETED_TTL_SECONDS = int(os.getenv("ORDER_QUEUE_COMPLETED_TTL", "86400"))
+
+_workers_started = False
+
+
+def is_queued_mode():
+    return ORDER_INGEST_MODE == "queued"
+
+
+def allocate_order_id():
+    """Allocate the next OrderID from an atomic counter.
+
+    Queued orders are not in the orders collection yet and archived ones are
+    no longer in it, so "max OrderID + 1" would hand out duplicates; the
+    counter is seeded once from orders, the archive and the queue.
+    """
+    counter = counters.find_one_and_update(
+        {"_id": "OrderID"},
+        {"$inc": {"seq": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if counter:
+        return counter["seq"]
+
+    last_order_ids = [
+        order["OrderID"] for order in (
+            collection.find_one(sort=[("OrderID", -1)], projection={"OrderID": 1})
+            for collection in (orders_collection, orders_archive)
+        ) if order
+    ]
+    last_queued = order_queue.find_one(sort=[("_id", -1)], projection={"_id": 1})
+    seed = max(last_order_ids + [last_queued["_id"] if last_queued else 0])
+    print(f"Seeding OrderID counter at {seed}", flush=True)
+    counters.update_one({"_id": "OrderID"}, {"$max": {"seq": seed}}, upsert=True)
+    return allocate_order_id()
+
+
+def reserve_stock(book_id_quantity):
+    """Take stock for an order up front with guarded decrements.
+
+    Returns None when every book had enough stock, otherwise the BookID that
+    ran short; decrements already applied for the order are rolled back.
+    Queued orders must reserve before they are accepted - the workers drain
+    the queue later, so checking stock alone would let every buyer ahead of
+    the drain have the same last copy.
+    """
+    reserved = {}
+    try:
+        for book_id_str, quantity in book_id_quantity.items():
+            book_id = int(book_id_str)
+            result = books_collection.update_one(
+                {"BookID": book_id, "BookQuantity": {"$gte": quantity}},
+                {"$inc": {"BookQuantity": -quantity}}
+            )
+            if not result.modified_count:
+                release_stock(reserved)
+                return book_id
+            reserved[book_id_str] = quantity
+    except PyMongoError:
+        release_stock(reserved)
+        raise
+    return None
+
+
+def release_stock(book_id_quantity):
+    """Give back stock taken by reserve_stock"""
+    for book_id_str, quantity in book_id_quantity.items():
+        books_collection.update_one({"BookID": int(book_id_str)}, {"$inc": {"BookQuantity": quantity}})
+
+
+def enqueue_order(order):
+    """Durably queue a validated order whose stock is already reserved.
+
+    The OrderID doubles as the queue entry _id.
+    """
+    order_queue.insert_one({
+        "_id": order["OrderID"],
+        "Order": order,
+        "Status": "queued",
+        "Attempts": 0,
+        "EnqueuedAt": datetime.utcnow()
+    })
+
+
+def get_order_status(order_id):
+    """Return (status, customer_id, error) for a queued order, or None if it was never queued"""
+    entry = order_queue.find_one(
+        {"_id": order_id},
+        {"Status": 1, "Order.CustomerID": 1, "Error": 1}
+    )
+    if not entry:
+        return None
+    return entry["Status"], entry["Order"]["CustomerID"], entry.get("Error")
+
+
+def ensure_queue_indexes():
+    order_queue.create_index([("Status", 1), ("_id", 1)])
+    order_queue.create_index("CompletedAt", expireAfterSeconds=COMPLETED_TTL_SECONDS)
+
+
+def _claim_batch():
+    """Claim up to QUEUE_BATCH_SIZE entries, including ones abandoned by a crashed worker"""
+    stale_before = datetime.utcnow() - timedelta(seconds=CLAIM_TIMEOUT_SECONDS)
+    claimable = {"$or": [
+        {"Status": "queued"},
+        {"Status": "processing", "ClaimedAt": {"$lt": stale_before}}
+    ]}
+
+    candidate_ids = [
+        entry["_id"] for entry in
+        order_queue.find(claimable, {"_id": 1}).sort("_id", 1).limit(QUEUE_BATCH_SIZE)
+    ]
+    if not candidate_ids:
+        return []
+
+    claim_token = uuid.uuid4().hex
+    order_queue.update_many(
+        {"_id": {"$in": candidate_ids}, **claimable},
+        {"$set": {"Status": "processing", "ClaimToken": claim_token, "ClaimedAt": datetime.utcnow()},
+         "$inc": {"Attempts": 1}}
+    )
+    return list(order_queue.find({"ClaimToken": claim_token, "Status": "processing"}))
+
+
+def _inserted_ids(entry_ids):
+    return set(orders_collection.distinct("OrderID", {"OrderID": {"$in": entry_ids}}))
+
+
+def _mark_completed(entry_ids, claim_token):
+    # Scoped to our claim: if the entries were reclaimed after a timeout, the new owner finishes them
+    order_queue.update_many(
+        {"_id": {"$in": entry_ids}, "ClaimToken": claim_token},
+        {"$set": {"Status": "completed", "CompletedAt": datetime.utcnow()},
+         "$unset": {"ClaimToken": "", "ClaimedAt": ""}}
+    )
+
+
+def _process_batch(batch):
+    """Insert a batch of orders with one bulk write.
+
+    Stock was reserved when each order was queued, so the only write here is
+    the insert; entries on a retry are checked against the orders collection
+    first. If a slow worker's claim was taken over mid-insert, the unique
+    OrderID index rejects the second insert and _release_batch completes
+    the entry.
+    """
+    entry_ids = [entry["_id"] for entry in batch]
+    claim_token = batch[0]["ClaimToken"]
+    retried_ids = [entry["_id"] for entry in batch if entry.get("Attempts", 1) > 1]
+    already_inserted = _inserted_ids(retried_ids) if retried_ids else set()
+    to_insert = [entry["Order"] for entry in batch if entry["_id"] not in already_inserted]
+
+    if to_insert:
+        orders_collection.insert_many(to_insert, ordered=False)
+
+    _mark_completed(entry_ids, claim_token)
+    notify_order_created({
+        int(book_id_str) for entry in batch for book_id_str in entry["Order"]["BookIDQuantity"]
+    })
+    print(f"Order queue drained {len(batch)} orders ({len(to_insert)} inserted)", flush=True)
+
+
+def _release_batch(batch, error):
+    """Put a failed batch back on the queue, giving up on entries that keep failing.
+
+    Entries that reached the orders collection are completed, never failed.
+    Entries given up on return their reserved stock.
+    """
+    entry_ids = [entry["_id"] for entry in batch]
+    claim_token = batch[0]["ClaimToken"]
+    inserted = _inserted_ids(entry_ids)
+    if inserted:
+        _mark_completed(list(inserted), claim_token)
+
+    for entry in batch:
+        if entry["_id"] in inserted or entry.get("Attempts", 1) < MAX_ATTEMPTS:
+            continue
+        # Only the call that flips the entry to failed gives the stock back
+        failed = order_queue.update_one(
+            {"_id": entry["_id"], "Status": "processing", "ClaimToken": claim_token},
+            {"$set": {"Status": "failed", "Error": f"Order could not be saved: {error}"},
+             "$unset": {"ClaimToken": "", "ClaimedAt": ""}}
+        )
+        if failed.modified_count:
+            release_stock(entry["Order"]["BookIDQuantity"])
+
+    order_queue.update_many(
+        {"_id": {"$in": entry_ids}, "ClaimToken": claim_token, "Attempts": {"$lt": MAX_ATTEMPTS}},
+        {"$set": {"Status": "queued"}, "$unset": {"ClaimToken": "", "ClaimedAt": ""}}
+    )
+
+
+def _queue_worker(create_indexes=False):
+    if create_indexes:
+        # Off the startup path: a cold worker should not wait on Mongo to serve requests
+        try:
+            ensure_queue_indexes()
+            # The unique OrderID index is what stops a reclaimed entry being inserted twice
+            ensure_order_indexes()
+        except PyMongoError as e:
+            print(f"Could not create order queue indexes: {e}", flush=True)
+
+    while True:
+        try:
+            batch = _claim_batch()
+        except PyMongoError as e:
+            print(f"=== ERROR claiming queued orders: {e} ===", flush=True)
+            time.sleep(QUEUE_POLL_SECONDS)
+            continue
+
+        if not batch:
+            time.sleep(QUEUE_POLL_SECONDS)
+            continue
+
+        try:
+            _process_batch(batch)
+        except Exception as e:
+            print(f"=== ERROR draining queued orders: {e} ===", flush=True)
+            try:
+                _release_batch(batch, e)
+            except PyMongoError as release_error:
+                # The claim times out and another worker picks the batch up
+                print(f"=== ERROR releasing queued orders: {release_error} ===", flush=True)
+
+
+def start_queue_workers():
+    """Start the worker pool that drains the order queue (queued mode only)"""
+    global _workers_started
+    if _workers_started or not is_queued_mode():
+        return
+    _workers_started = True
+
+    for worker_number in range(QUEUE_WORKERS):
+        threading.Thread(
+            target=_queue_worker,
+            args=(worker_number == 0,),
+            name=f"order-queue-{worker_number}",
+            daemon=True
+        ).start()
+    print(f"Order queue started with {QUEUE_WORKERS} workers (batch size {QUEUE_BATCH_SIZE})", flush=True)
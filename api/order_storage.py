@@ -0,0 +1,151 @@
+from .mongo import get_collection
+from datetime import datetime, timedelta, timezone
+import argparse
+import os
+
+# MongoDB connection
+orders_collection = get_collection("orders")
+# Cold storage for orders older than the archive cutoff
+orders_archive = get_collection("orders_archive")
+
+# "string" keeps the legacy ISO string OrderDate, "date" writes native BSON dates.
+# Both modes record UTC, so reports bucket every order by the same (UTC) day.
+# Switch to "date" once `python -m api.order_storage migrate` has converted old orders.
+ORDER_DATE_STORAGE = os.getenv("ORDER_DATE_STORAGE", "string").lower()
+ARCHIVE_AFTER_DAYS = int(os.getenv("ORDER_ARCHIVE_AFTER_DAYS", "365"))
+MIGRATION_BATCH_SIZE = 1000
+# ISO strings ending in an explicit UTC offset, e.g. "+00:00" or "Z"
+OFFSET_SUFFIX = r"(Z|[+-][0-9]{2}:[0-9]{2})$"
+
+
+def order_timestamp():
+    """OrderDate value for a new order in the configured storage mode, always UTC"""
+    now = datetime.now(timezone.utc)
+    if ORDER_DATE_STORAGE == "date":
+        return now
+    # With an explicit offset, unlike the legacy local-time strings
+    return now.isoformat()
+
+
+def format_order_date(value):
+    """Render OrderDate for JSON responses; BSON dates come back as naive UTC datetimes"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.isoformat()
+    return value
+
+
+def ensure_order_indexes():
+    """Create the indexes order reads rely on, on both tiers.
+
+    (CustomerID, OrderDate) serves order history and date-range queries;
+    (CustomerID, OrderID) serves the keyset-paginated customer exports.
+    OrderID is unique so a queued order can never be inserted twice.
+    """
+    for collection in (orders_collection, orders_archive):
+        collection.create_index([("CustomerID", 1), ("OrderDate", -1)])
+        collection.create_index([("CustomerID", 1), ("OrderID", 1)])
+        existing = collection.index_information().get("OrderID_1")
+        if existing and not existing.get("unique"):
+            # Created non-unique before; the options of an existing index cannot be changed in place
+            collection.drop_index("OrderID_1")
+        collection.create_index("OrderID", unique=True)
+    orders_collection.create_index("OrderDate")
+    print("Order indexes ensured", flush=True)
+
+
+def _batches_of_ids(collection, query):
+    """Yield _id batches matching query, walking _id upwards so every batch is visited once"""
+    last_id = None
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        ids = [doc["_id"] for doc in
+               collection.find(batch_query, {"_id": 1}).sort("_id", 1).limit(MIGRATION_BATCH_SIZE)]
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def migrate_string_dates(source_timezone="UTC"):
+    """Convert ISO string OrderDates to BSON dates in place.
+
+    Legacy strings carry no offset, so source_timezone names the zone the
+    API server was writing them in (e.g. "Africa/Johannesburg"); strings
+    written with an offset (UTC since string mode switched to UTC) use it.
+    """
+    converted = 0
+    for collection in (orders_collection, orders_archive):
+        for ids in _batches_of_ids(collection, {"OrderDate": {"$type": "string"}}):
+            result = collection.update_many(
+                {"_id": {"$in": ids}, "OrderDate": {"$type": "string"}},
+                [{"$set": {"OrderDate": {"$cond": [
+                    # $dateFromString refuses a timezone for a string that has its own offset
+                    {"$regexMatch": {"input": "$OrderDate", "regex": OFFSET_SUFFIX}},
+                    {"$dateFromString": {"dateString": "$OrderDate", "onError": "$OrderDate"}},
+                    {"$dateFromString": {
+                        "dateString": "$OrderDate",
+                        "timezone": source_timezone,
+                        "onError": "$OrderDate"
+                    }}
+                ]}}}]
+            )
+            converted += result.modified_count
+            print(f"Migrated {converted} order dates in {collection.name}...", flush=True)
+    print(f"Order date migration finished: {converted} orders converted", flush=True)
+    return converted
+
+
+def _older_than(cutoff):
+    """Query for orders placed before cutoff, whether OrderDate is a BSON date or an ISO string"""
+    # ISO strings compare correctly as strings; the trailing offset sorts after the shorter cutoff
+    return {"$or": [
+        {"OrderDate": {"$lt": cutoff}},
+        {"OrderDate": {"$lt": cutoff.replace(tzinfo=None).isoformat(), "$type": "string"}}
+    ]}
+
+
+def archive_orders(older_than_days=ARCHIVE_AFTER_DAYS):
+    """Move orders older than the cutoff into orders_archive, batch by batch.
+
+    Each batch is copied with $merge before it is deleted from the hot
+    collection, so an interrupted run never loses orders.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    moved = 0
+    for ids in _batches_of_ids(orders_collection, _older_than(cutoff)):
+        orders_collection.aggregate([
+            {"$match": {"_id": {"$in": ids}}},
+            {"$merge": {"into": "orders_archive", "on": "_id",
+                        "whenMatched": "keepExisting", "whenNotMatched": "insert"}}
+        ])
+        orders_collection.delete_many({"_id": {"$in": ids}})
+        moved += len(ids)
+        print(f"Archived {moved} orders...", flush=True)
+    print(f"Archive finished: {moved} orders older than {older_than_days} days moved", flush=True)
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order storage maintenance")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('indexes', help="create the order history and export indexes")
+    migrate = commands.add_parser('migrate', help="convert string OrderDates to BSON dates")
+    migrate.add_argument('--timezone', default="UTC", help="zone the legacy strings were written in")
+    archive = commands.add_parser('archive', help="move old orders to orders_archive")
+    archive.add_argument('--older-than-days', type=int, default=ARCHIVE_AFTER_DAYS)
+    args = parser.parse_args()
+
+    if args.command == 'indexes':
+        ensure_order_indexes()
+    elif args.command == 'migrate':
+        migrate_string_dates(args.timezone)
+    elif args.command == 'archive':
+        archive_orders(args.older_than_days)
+
+
+if __name__ == '__main__':
+    main()
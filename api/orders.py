@@ -1,18 +1,68 @@
-from flask import Blueprint, jsonify, session, request
+from flask import Blueprint, jsonify, session, request, Response, stream_with_context
 from flask_cors import cross_origin
-from pymongo import MongoClient
-import os
+from .mongo import get_collection
 from datetime import datetime
+from .analytics import notify_order_created
+from .idempotency import idempotent
+from .cart_quote import quote_cart, first_error
+from .book_index import book_index
+from .order_storage import order_timestamp, format_order_date, orders_archive
+from .order_export import export_orders, DEFAULT_BATCH_SIZE
+from .read_routing import for_route, causal_session, remember_causal_token
+from .order_queue import (is_queued_mode, enqueue_order, get_order_status, allocate_order_id,
+                          reserve_stock, release_stock)
 
 orders_bp = Blueprint('orders', __name__)
 
 # MongoDB connection (update URI as needed)
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-client = MongoClient(MONGO_URI)
-db = client["bookstore"]
-orders_collection = db["orders"]
-books_collection = db["books"]
-customers_collection = db["customers"]
+orders_collection = get_collection("orders")
+books_collection = get_collection("books")
+customers_collection = get_collection("customers")
+
+# Read-only views with per-route read preferences (see read_routing.py);
+# checkout validation and writes keep using the primary collections above
+catalog_books = for_route(books_collection, "catalog")
+customer_orders_reads = for_route(orders_collection, "customer_orders")
+order_details_reads = for_route(orders_collection, "order_details")
+export_reads = for_route(orders_collection, "export")
+archive_reads = for_route(orders_archive, "export")
+
+def _book_details_for(orders):
+    """BookID -> display details for every book in the given orders.
+
+    Titles and prices come from the in-memory book index; the remaining
+    fields are fetched for all books in a single $in query.
+    """
+    book_ids = {int(book_id_str) for order in orders for book_id_str in order.get('BookIDQuantity', {})}
+    if not book_ids:
+        return {}
+
+    indexed = {book_id: book_index.lookup(book_id) for book_id in book_ids}
+    projection = {"_id": 0, "BookID": 1, "AuthorName": 1, "BookPublisher": 1, "BookPublicationDate": 1}
+    if None in indexed.values():
+        # Books the index has not seen yet (e.g. still loading) are read from Mongo
+        projection.update({"BookTitle": 1, "BookPrice": 1})
+
+    book_details = {}
+    for book in catalog_books.find({"BookID": {"$in": list(book_ids)}}, projection):
+        book_price, book_title = indexed[book["BookID"]] or (book["BookPrice"], book["BookTitle"])
+        book_details[book["BookID"]] = {
+            "BookID": book["BookID"],
+            "BookTitle": book_title,
+            "AuthorName": book["AuthorName"],
+            "BookPrice": book_price,
+            "BookPublisher": book.get("BookPublisher", "Unknown Publisher"),
+            "BookPublicationDate": book.get("BookPublicationDate", "Unknown Date")
+        }
+    return book_details
+
+def _order_lines(order, book_details):
+    """Book lines of an order; books no longer in the catalog are left out"""
+    return [
+        {**book_details[int(book_id_str)], "quantity": quantity}
+        for book_id_str, quantity in order.get('BookIDQuantity', {}).items()
+        if int(book_id_str) in book_details
+    ]
 
 @orders_bp.route('/test-db', methods=['GET'])
 @cross_origin(origins=['http://localhost:3000'], supports_credentials=True)
@@ -53,6 +103,7 @@ def test_database():
 
 @orders_bp.route('/create', methods=['POST'])
 @cross_origin(origins=['http://localhost:3000'], supports_credentials=True)
+@idempotent
 def create_order():
     """Create a new order with debugging"""
     try:
@@ -83,67 +134,21 @@ def create_order():
             print("No books specified in order", flush=True)
             return jsonify({'error': 'No books specified'}), 400
 
-        # Validate and calculate order details
-        book_id_quantity = {}
-        total_price = 0
-        
-        for book_item in books_data:
-            book_id = book_item.get('bookID')
-            quantity = book_item.get('quantity')
-            
-            print(f"Processing book: ID={book_id}, quantity={quantity}", flush=True)
-            
-            if not book_id or not quantity or quantity <= 0:
-                print(f"Invalid book or quantity: {book_item}", flush=True)
-                return jsonify({'error': f'Invalid book or quantity: {book_item}'}), 400
-            
-            # Get book details and check availability
-            book = books_collection.find_one({"BookID": book_id})
-            
-            if book:
-                print(f"[SUCCESS] Book found: {book['BookTitle']} (ID: {book['BookID']})", flush=True)
-                print(f"   Available quantity: {book['BookQuantity']}", flush=True)
-                print(f"   Book price: ${book['BookPrice']}", flush=True)
-            else:
-                print(f"[ERROR] Book not found for ID: {book_id}", flush=True)
-                
-            # Special debugging for BookID 0
-            if book_id == 0:
-                print(f"[DEBUG] DEBUGGING BookID 0:", flush=True)
-                print(f"   Book data: {book}", flush=True)
-                print(f"   Requested quantity: {quantity}", flush=True)
-                print(f"   Available quantity: {book['BookQuantity'] if book else 'N/A'}", flush=True)
-                print(f"   Quantity check: {book['BookQuantity'] >= quantity if book else 'N/A'}", flush=True)
-            
-            if not book:
-                print(f"Book with ID {book_id} not found in database", flush=True)
-                return jsonify({'error': f'Book with ID {book_id} not found'}), 404
-            
-            if book['BookQuantity'] < quantity:
-                print(f"Insufficient stock for book {book_id}: available={book['BookQuantity']}, requested={quantity}", flush=True)
-                return jsonify({'error': f'Insufficient stock for "{book["BookTitle"]}". Available: {book["BookQuantity"]}, Requested: {quantity}'}), 400
-            
-            book_id_quantity[str(book_id)] = quantity
-            total_price += book['BookPrice'] * quantity
-            print(f"Added to order: {book['BookTitle']} x{quantity} = ${book['BookPrice'] * quantity}", flush=True)
+        # Validate and price the cart with the same core as /quote
+        quote = quote_cart(books_data)
+        failure = first_error(quote)
+        if failure:
+            message, status_code = failure
+            print(f"Cart rejected: {message}", flush=True)
+            return jsonify({'error': message}), status_code
 
+        book_id_quantity = quote['bookIDQuantity']
+        total_price = quote['totalPrice']
         print(f"Order totals: {len(book_id_quantity)} items, ${total_price}", flush=True)
 
         # Get the next OrderID
-        try:
-            last_order = orders_collection.find_one(sort=[("OrderID", -1)])
-            if last_order:
-                next_order_id = last_order['OrderID'] + 1
-                print(f"Last order ID: {last_order['OrderID']}, next: {next_order_id}", flush=True)
-            else:
-                next_order_id = 1
-                print("No existing orders, starting with ID 1", flush=True)
-        except Exception as id_error:
-            print(f"Error getting next order ID: {id_error}", flush=True)
-            # Fallback: count existing orders and add 1
-            order_count = orders_collection.count_documents({})
-            next_order_id = order_count + 1
-            print(f"Fallback: order count={order_count}, next ID={next_order_id}", flush=True)
+        next_order_id = allocate_order_id()
+        print(f"Allocated OrderID: {next_order_id}", flush=True)
 
         # Create the order
         order = {
@@ -151,57 +156,80 @@ def create_order():
             "CustomerID": customer_id,
             "BookIDQuantity": book_id_quantity,
             "OrderPrice": round(total_price, 2),
-            "OrderDate": datetime.now().isoformat()
+            "OrderDate": order_timestamp()
         }
 
         print(f"Order to be inserted: {order}", flush=True)
 
-        # Insert the order
+        if is_queued_mode():
+            # Write-behind: stock is reserved now, the queue workers insert the order in batches
+            short_book_id = reserve_stock(book_id_quantity)
+            if short_book_id is not None:
+                title = next((line.get('BookTitle') for line in quote['lines']
+                              if line['bookID'] == short_book_id), short_book_id)
+                print(f"Stock ran out for book {short_book_id} before order {next_order_id} was queued", flush=True)
+                return jsonify({'error': f'Insufficient stock for "{title}"'}), 400
+
+            try:
+                enqueue_order(order)
+            except Exception as queue_error:
+                print(f"[ERROR] Failed to queue order: {queue_error}", flush=True)
+                release_stock(book_id_quantity)
+                return jsonify({'error': f'Failed to queue order: {str(queue_error)}'}), 500
+
+            print(f"Order {next_order_id} queued", flush=True)
+            return jsonify({
+                'success': True,
+                'message': 'Order received and queued for processing',
+                'orderID': next_order_id,
+                'totalPrice': round(total_price, 2),
+                'status': 'queued',
+                'statusUrl': f'/api/orders/status/{next_order_id}'
+            }), 202
+
+        # Insert the order in a causally consistent session so the customer's
+        # next order reads wait for this write, even on a secondary
         print(f"About to insert order into MongoDB...", flush=True)
-        try:
-            result = orders_collection.insert_one(order)
-            print(f"MongoDB insert_one result: {result}", flush=True)
-            print(f"Inserted ID: {result.inserted_id}", flush=True)
-            print(f"Acknowledged: {result.acknowledged}", flush=True)
+        with causal_session() as mongo_session:
+            try:
+                result = orders_collection.insert_one(order, session=mongo_session)
+                print(f"Inserted ID: {result.inserted_id}, acknowledged: {result.acknowledged}", flush=True)
+            except Exception as insert_error:
+                print(f"[ERROR] MongoDB insert failed: {insert_error}", flush=True)
+                return jsonify({'error': f'Database insert failed: {str(insert_error)}'}), 500
             
-            # Verify the order was actually inserted
-            inserted_order = orders_collection.find_one({"OrderID": next_order_id})
-            if inserted_order:
-                print(f"[SUCCESS] Order verified in database: {inserted_order}", flush=True)
-            else:
-                print("[ERROR] Order NOT found in database after insert!", flush=True)
-                return jsonify({'error': 'Order creation failed - not saved to database'}), 500
-                
-        except Exception as insert_error:
-            print(f"[ERROR] MongoDB insert failed: {insert_error}", flush=True)
-            return jsonify({'error': f'Database insert failed: {str(insert_error)}'}), 500
-        
-        if result.acknowledged:
+            if not result.acknowledged:
+                print("Failed to insert order into database", flush=True)
+                return jsonify({'error': 'Failed to create order - database insert failed'}), 500
+
             print("[SUCCESS] Order insertion acknowledged by MongoDB", flush=True)
             print("Updating book quantities...", flush=True)
             
             # Update book quantities
-            for book_item in books_data:
-                book_id = book_item.get('bookID')
-                quantity = book_item.get('quantity')
+            for book_id_str, quantity in book_id_quantity.items():
+                book_id = int(book_id_str)
                 
                 print(f"Updating stock for book {book_id}: reducing by {quantity}", flush=True)
                 update_result = books_collection.update_one(
                     {"BookID": book_id},
-                    {"$inc": {"BookQuantity": -quantity}}
+                    {"$inc": {"BookQuantity": -quantity}},
+                    session=mongo_session
                 )
                 print(f"Stock update result for book {book_id}: {update_result.modified_count} documents modified", flush=True)
+
+            remember_causal_token(mongo_session)
             
-            print(f"Order {next_order_id} created successfully!", flush=True)
-            return jsonify({
-                'success': True,
-                'message': 'Order created successfully',
-                'orderID': next_order_id,
-                'totalPrice': round(total_price, 2)
-            })
-        else:
-            print("Failed to insert order into database", flush=True)
-            return jsonify({'error': 'Failed to create order - database insert failed'}), 500
+        # Let the analytics worker fold this order into the summaries off the request path
+        notify_order_created(int(book_id) for book_id in book_id_quantity)
+        
+        print(f"Order {next_order_id} created successfully!", flush=True)
+        return jsonify({
+            'success': True,
+            'message': 'Order created successfully',
+            'orderID': next_order_id,
+            'totalPrice': round(total_price, 2),
+            'status': 'completed'
+        })
 
     except Exception as e:
         print(f"=== ERROR creating order: {e} ===", flush=True)
@@ -209,6 +237,59 @@ def create_order():
         print(f"Full traceback: {traceback.format_exc()}", flush=True)
         return jsonify({'error': f'Failed to create order: {str(e)}'}), 500
 
+@orders_bp.route('/quote', methods=['POST'])
+@cross_origin(origins=['http://localhost:3000'], supports_credentials=True)
+def quote_order():
+    """Re-validate a cart: per-line availability and totals, no writes"""
+    try:
+        if not session.get('currentUser'):
+            return jsonify({'error': 'Unauthorized - no user in session'}), 403
+
+        data = request.get_json()
+        books_data = data.get('books', [])  # same payload as /create
+        if not books_data:
+            return jsonify({'error': 'No books specified'}), 400
+
+        quote = quote_cart(books_data)
+        print(f"Quote for {len(books_data)} lines: valid={quote['valid']}, ${quote['totalPrice']}", flush=True)
+        return jsonify(quote)
+
+    except Exception as e:
+        print(f"=== ERROR quoting cart: {e} ===", flush=True)
+        return jsonify({'error': f'Failed to quote cart: {str(e)}'}), 500
+
+@orders_bp.route('/status/<int:order_id>')
+@cross_origin(origins=['http://localhost:3000'], supports_credentials=True)
+def get_order_status_route(order_id):
+    """Poll the processing status of an order (queued ingestion mode)"""
+    try:
+        current_user = session.get('currentUser')
+        if not current_user:
+            return jsonify({'error': 'Unauthorized'}), 403
+
+        queued = get_order_status(order_id)
+        if queued:
+            status, customer_id, error = queued
+        else:
+            # Orders created synchronously (or whose queue entry has expired) never show up in the queue
+            order = orders_collection.find_one({"OrderID": order_id}, {"CustomerID": 1})
+            if not order:
+                return jsonify({'error': 'Order not found'}), 404
+            status, customer_id, error = 'completed', order['CustomerID'], None
+
+        if customer_id != current_user['CustomerID']:
+            print(f"Unauthorized status check for order {order_id}", flush=True)
+            return jsonify({'error': 'Unauthorized'}), 403
+
+        response = {'orderID': order_id, 'status': status}
+        if error:
+            response['error'] = error
+        return jsonify(response)
+
+    except Exception as e:
+        print(f"Error fetching order status: {e}", flush=True)
+        return jsonify({'error': 'Failed to fetch order status'}), 500
+
 @orders_bp.route('/customer/<int:customer_id>')
 @cross_origin(origins=['http://localhost:3000'], supports_credentials=True)
 def get_customer_orders(customer_id):
@@ -223,41 +304,30 @@ def get_customer_orders(customer_id):
             return jsonify({'error': 'Unauthorized'}), 403
 
         # Find all orders for this customer
-        orders = list(orders_collection.find({"CustomerID": customer_id}))
+        # Newest first straight off the (CustomerID, OrderDate) index
+        with causal_session() as mongo_session:
+            orders = list(customer_orders_reads.find({"CustomerID": customer_id}, session=mongo_session).sort("OrderDate", -1))
+
+        # Orders moved to cold storage are only read when asked for
+        if request.args.get('include_archived', '0') in ('1', 'true'):
+            orders += list(archive_reads.find({"CustomerID": customer_id}).sort("OrderDate", -1))
         print(f"Found {len(orders)} orders for customer {customer_id}", flush=True)
         
         if not orders:
             return jsonify([])
 
-        # Enrich orders with book details
+        # Enrich orders with book details - one query for every book across the history
+        book_details = _book_details_for(orders)
         enriched_orders = []
         
         for order in orders:
-            # Get book details for each book in the order
-            books_in_order = []
-            
-            for book_id_str, quantity in order.get('BookIDQuantity', {}).items():
-                book_id = int(book_id_str)
-                book = books_collection.find_one({"BookID": book_id})
-                
-                if book:
-                    books_in_order.append({
-                        "BookID": book["BookID"],
-                        "BookTitle": book["BookTitle"],
-                        "AuthorName": book["AuthorName"],
-                        "BookPrice": book["BookPrice"],
-                        "BookPublisher": book.get("BookPublisher", "Unknown Publisher"),
-                        "BookPublicationDate": book.get("BookPublicationDate", "Unknown Date"),
-                        "quantity": quantity
-                    })
-            
             enriched_order = {
                 "OrderID": order["OrderID"],
                 "BookIDQuantity": order["BookIDQuantity"],
                 "OrderPrice": order["OrderPrice"],
-                "OrderDate": order["OrderDate"],
+                "OrderDate": format_order_date(order["OrderDate"]),
                 "CustomerID": order["CustomerID"],
-                "books": books_in_order
+                "books": _order_lines(order, book_details)
             }
             
             enriched_orders.append(enriched_order)
@@ -272,6 +342,34 @@ def get_customer_orders(customer_id):
         print(f"Error fetching orders: {e}", flush=True)
         return jsonify({'error': 'Failed to fetch orders'}), 500
 
+@orders_bp.route('/customer/<int:customer_id>/export')
+@cross_origin(origins=['http://localhost:3000'], supports_credentials=True)
+def export_customer_orders(customer_id):
+    """Stream a customer's full order history as NDJSON or CSV, optionally gzipped"""
+    current_user = session.get('currentUser')
+    if not current_user or current_user['CustomerID'] != customer_id:
+        print(f"Unauthorized export of customer {customer_id} orders", flush=True)
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    compress = request.args.get('gzip', '0') in ('1', 'true')
+    batch_size = request.args.get('batch_size', DEFAULT_BATCH_SIZE, type=int)
+
+    print(f"=== EXPORT CUSTOMER ORDERS: {customer_id} ({export_format}, gzip={compress}) ===", flush=True)
+    filename = f"orders_{customer_id}.{export_format}" + ('.gz' if compress else '')
+    mimetype = 'application/gzip' if compress else ('text/csv' if export_format == 'csv' else 'application/x-ndjson')
+
+    # Archived orders first - they all predate the ones still in the hot collection
+    chunks = export_orders(customer_id, export_format, compress, batch_size,
+                           collections=[archive_reads, export_reads])
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
 @orders_bp.route('/<int:order_id>')
 @cross_origin(origins=['http://localhost:3000'], supports_credentials=True)
 def get_order_details(order_id):
@@ -284,7 +382,10 @@ def get_order_details(order_id):
         if not current_user:
             return jsonify({'error': 'Unauthorized'}), 403
 
-        order = orders_collection.find_one({"OrderID": order_id})
+        with causal_session() as mongo_session:
+            order = order_details_reads.find_one({"OrderID": order_id}, session=mongo_session)
+        if not order:
+            order = archive_reads.find_one({"OrderID": order_id})
         
         if not order:
             print(f"Order {order_id} not found", flush=True)
@@ -294,31 +395,13 @@ def get_order_details(order_id):
             print(f"Unauthorized access to order {order_id}", flush=True)
             return jsonify({'error': 'Unauthorized'}), 403
 
-        # Get book details for each book in the order
-        books_in_order = []
-        
-        for book_id_str, quantity in order.get('BookIDQuantity', {}).items():
-            book_id = int(book_id_str)
-            book = books_collection.find_one({"BookID": book_id})
-            
-            if book:
-                books_in_order.append({
-                    "BookID": book["BookID"],
-                    "BookTitle": book["BookTitle"],
-                    "AuthorName": book["AuthorName"],
-                    "BookPrice": book["BookPrice"],
-                    "BookPublisher": book.get("BookPublisher", "Unknown Publisher"),
-                    "BookPublicationDate": book.get("BookPublicationDate", "Unknown Date"),
-                    "quantity": quantity
-                })
-        
         detailed_order = {
             "OrderID": order["OrderID"],
             "BookIDQuantity": order["BookIDQuantity"],
             "OrderPrice": order["OrderPrice"],
-            "OrderDate": order["OrderDate"],
+            "OrderDate": format_order_date(order["OrderDate"]),
             "CustomerID": order["CustomerID"],
-            "books": books_in_order
+            "books": _order_lines(order, _book_details_for([order]))
         }
         
         print(f"Returning order details for order {order_id}", flush=True)
@@ -0,0 +1,231 @@
+from flask import Blueprint, request, jsonify, g, send_from_directory, abort
+import cProfile
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Profiling is opt-in: when disabled no hooks are installed, so there is no per-request cost
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+# Fraction of requests profiled without being asked (0 = only on X-Profile header)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# "cprofile" (deterministic, pstats output) or "sample" (stack sampler, speedscope output)
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sample")
+PROFILE_DIR = os.path.abspath(os.getenv("PROFILE_DIR", "profiles"))
+# Required for the X-Profile header trigger and the admin endpoints (sent as X-Profile-Token);
+# without it only PROFILE_SAMPLE_RATE profiling runs
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+SAMPLE_INTERVAL_SECONDS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000
+MAX_PROFILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+PROFILE_MODES = ("cprofile", "sample")
+
+profiling_bp = Blueprint('profiling', __name__)
+
+
+class StackSampler:
+    """Low-overhead sampler: a helper thread snapshots one thread's stack at a fixed interval"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.frames = []
+        self._frame_index = {}
+        self.samples = []
+        self.weights = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _frame_id(self, frame):
+        code = frame.f_code
+        key = (code.co_filename, code.co_name, code.co_firstlineno)
+        if key not in self._frame_index:
+            self._frame_index[key] = len(self.frames)
+            self.frames.append({'name': code.co_name, 'file': code.co_filename, 'line': code.co_firstlineno})
+        return self._frame_index[key]
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame))
+                frame = frame.f_back
+            stack.reverse()  # speedscope wants root first
+
+            now = time.perf_counter()
+            self.samples.append(stack)
+            self.weights.append((now - last) * 1000)
+            last = now
+
+    def dump(self, path, name):
+        with open(path, 'w') as f:
+            json.dump({
+                '$schema': 'https://www.speedscope.app/file-format-schema.json',
+                'name': name,
+                'exporter': 'bookstore-api',
+                'shared': {'frames': self.frames},
+                'profiles': [{
+                    'type': 'sampled',
+                    'name': name,
+                    'unit': 'milliseconds',
+                    'startValue': 0,
+                    'endValue': self.duration * 1000,
+                    'samples': self.samples,
+                    'weights': self.weights
+                }]
+            }, f)
+
+
+def _token_ok():
+    token = request.headers.get('X-Profile-Token', '')
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+def _requested_mode():
+    """Profiling mode for this request, or None to leave it alone"""
+    header = request.headers.get('X-Profile')
+    if header:
+        if not _token_ok():
+            return None
+        return header if header in PROFILE_MODES else PROFILE_MODE
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return PROFILE_MODE
+    return None
+
+
+def _profile_path(mode):
+    endpoint = re.sub(r'[^A-Za-z0-9_.-]', '_', request.endpoint or 'unknown')
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    extension = 'pstats' if mode == 'cprofile' else 'speedscope.json'
+    return os.path.join(PROFILE_DIR, f"{stamp}_{endpoint}.{extension}")
+
+
+def _prune_old_profiles():
+    profiles = sorted(
+        (entry for entry in os.scandir(PROFILE_DIR) if entry.is_file()),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in profiles[:max(len(profiles) - MAX_PROFILES, 0)]:
+        os.remove(entry.path)
+
+
+def _start_profile():
+    if request.method == 'OPTIONS' or request.blueprint == 'profiling':
+        return
+    mode = _requested_mode()
+    if not mode:
+        return
+
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Only one cProfile can be active at a time on newer Pythons
+            print("Skipping cProfile - another profile is already running", flush=True)
+            return
+    else:
+        profiler = StackSampler(threading.get_ident(), SAMPLE_INTERVAL_SECONDS)
+        profiler.start()
+
+    g.profile = (mode, profiler, time.perf_counter())
+
+
+def _finish_profile(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+
+    mode, profiler, started = profile
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    path = _profile_path(mode)
+    try:
+        if mode == 'cprofile':
+            profiler.disable()
+            profiler.dump_stats(path)
+        else:
+            profiler.stop()
+            profiler.dump(path, f"{request.method} {request.path}")
+        _prune_old_profiles()
+    except OSError as e:
+        print(f"=== ERROR writing profile: {e} ===", flush=True)
+        return response
+
+    print(f"Profiled {request.method} {request.path} ({elapsed_ms:.1f}ms) -> {path}", flush=True)
+    if _token_ok():
+        response.headers['X-Profile-File'] = os.path.basename(path)
+    return response
+
+
+def _discard_profile(exc):
+    # after_request is skipped if the response could not be built - never leak a running sampler
+    profile = g.pop('profile', None)
+    if profile is not None:
+        mode, profiler, started = profile
+        if mode == 'cprofile':
+            profiler.disable()
+        else:
+            profiler.stop()
+
+
+@profiling_bp.route('/profiles')
+def list_profiles():
+    """Most recent profiles, newest first"""
+    if not _token_ok():
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    limit = request.args.get('limit', 50, type=int)
+    entries = sorted(
+        (entry for entry in os.scandir(PROFILE_DIR) if entry.is_file()),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True
+    )[:limit]
+    return jsonify([{
+        'name': entry.name,
+        'sizeBytes': entry.stat().st_size,
+        'createdAt': datetime.fromtimestamp(entry.stat().st_mtime).isoformat(),
+        'url': f'/api/admin/profiles/{entry.name}'
+    } for entry in entries])
+
+
+@profiling_bp.route('/profiles/<path:name>')
+def download_profile(name):
+    if not _token_ok():
+        return jsonify({'error': 'Unauthorized'}), 403
+    if os.path.basename(name) != name:
+        abort(404)
+    return send_from_directory(PROFILE_DIR, name, as_attachment=True)
+
+
+def init_profiling(app):
+    """Install the per-request profiling hooks and admin endpoints when PROFILING_ENABLED=1"""
+    if not PROFILING_ENABLED:
+        return
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_discard_profile)
+    if PROFILE_TOKEN:
+        app.register_blueprint(profiling_bp, url_prefix='/api/admin')
+    else:
+        print("PROFILE_TOKEN is not set - X-Profile and /api/admin/profiles are disabled", flush=True)
+    print(f"Profiling enabled ({PROFILE_MODE}, sample rate {PROFILE_SAMPLE_RATE}) -> {PROFILE_DIR}", flush=True)
@@ -0,0 +1,229 @@
+from flask import request, session, jsonify, g
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from .mongo import get_collection
+from collections import OrderedDict
+import math
+import os
+import threading
+import time
+
+# Token bucket per route class: (bucket capacity, tokens refilled per second)
+RATE_LIMITS = {
+    "login": (5, 5 / 60),
+    "checkout": (10, 1),
+    "order_history": (10, 1),
+    "orders": (30, 5),
+    "catalog": (60, 10),
+    "default": (60, 20),
+}
+
+# Endpoint -> route class; unlisted endpoints fall into "default"
+ROUTE_CLASSES = {
+    "auth.login": "login",
+    "orders.create_order": "checkout",
+    "orders.quote_order": "orders",
+    "orders.get_customer_orders": "order_history",
+    "orders.export_customer_orders": "order_history",
+    "orders.get_order_details": "orders",
+    "orders.get_order_status_route": "orders",
+    "books.get_all_books": "catalog",
+    "books.get_books_from_db": "catalog",
+}
+
+# Route classes in the priority lane - they may use the reserved worker slots
+PRIORITY_ROUTES = {"checkout", "login"}
+
+# Concurrency caps for route classes that are expensive per request
+ROUTE_CONCURRENCY = {
+    "order_history": int(os.getenv("ORDER_HISTORY_MAX_CONCURRENT", "4")),
+}
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory").lower()
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "32"))
+RESERVED_PRIORITY_SLOTS = int(os.getenv("RESERVED_PRIORITY_SLOTS", "8"))
+MAX_TRACKED_CLIENTS = 100000
+
+
+class MemoryBucketStore:
+    """Token buckets kept in this process.
+
+    Buckets are kept in least recently used order and capped at
+    MAX_TRACKED_CLIENTS, so an IP-spread flood costs O(1) per request: the
+    stalest bucket is dropped (the client it belonged to simply starts full
+    again) instead of scanning every bucket under the lock.
+    """
+
+    def __init__(self, max_buckets=MAX_TRACKED_CLIENTS):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self.max_buckets = max_buckets
+
+    def take(self, key, capacity, refill_rate):
+        """Take one token; returns 0 when allowed, otherwise seconds until a token is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                retry_after = 0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry_after = (1 - tokens) / refill_rate
+
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+
+        return retry_after
+
+
+class MongoBucketStore:
+    """Token buckets shared by every worker through a Mongo collection.
+
+    Each take is a single atomic pipeline update computed on the server clock,
+    so workers on different hosts see the same buckets.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._index_ensured = False
+
+    def _ensure_index(self):
+        # Created on first use rather than at startup, so workers come up without waiting on Mongo
+        self._index_ensured = True
+        try:
+            # Buckets untouched for an hour are full again; let Mongo drop them
+            self.collection.create_index("updated", expireAfterSeconds=3600)
+        except PyMongoError as e:
+            print(f"Could not create rate limit TTL index: {e}", flush=True)
+
+    def take(self, key, capacity, refill_rate):
+        if not self._index_ensured:
+            self._ensure_index()
+        elapsed_ms = {"$subtract": ["$$NOW", {"$ifNull": ["$updated", "$$NOW"]}]}
+        bucket = self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {
+                    "tokens": {"$min": [capacity, {"$add": [
+                        {"$ifNull": ["$tokens", capacity]},
+                        {"$multiply": [elapsed_ms, refill_rate / 1000]}
+                    ]}]},
+                    "updated": "$$NOW"
+                }},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", 1]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]}
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket["allowed"]:
+            return 0
+        return (1 - bucket["tokens"]) / refill_rate
+
+
+class AdmissionController:
+    """Caps in-flight requests overall and per route class.
+
+    Normal traffic may only use MAX_CONCURRENT_REQUESTS - RESERVED_PRIORITY_SLOTS
+    slots, so checkout always has room even while catalog browsing is saturated.
+    """
+
+    def __init__(self, max_concurrent, reserved_priority_slots, route_limits):
+        self._lock = threading.Lock()
+        self.max_concurrent = max_concurrent
+        self.normal_limit = max(max_concurrent - reserved_priority_slots, 1)
+        self.route_limits = route_limits
+        self.active = 0
+        self.active_by_route = {}
+
+    def try_acquire(self, route_class, priority):
+        with self._lock:
+            limit = self.max_concurrent if priority else self.normal_limit
+            if self.active >= limit:
+                return False
+
+            route_active = self.active_by_route.get(route_class, 0)
+            route_limit = self.route_limits.get(route_class)
+            if route_limit is not None and route_active >= route_limit:
+                return False
+
+            self.active += 1
+            self.active_by_route[route_class] = route_active + 1
+            return True
+
+    def release(self, route_class):
+        with self._lock:
+            self.active -= 1
+            self.active_by_route[route_class] -= 1
+
+
+def _client_key(route_class):
+    """Buckets are per logged-in customer, falling back to the client IP"""
+    user = session.get('currentUser')
+    if user:
+        return f"{route_class}:customer:{user['CustomerID']}"
+    return f"{route_class}:ip:{request.remote_addr}"
+
+
+def _rejection(status_code, message, retry_after):
+    response = jsonify({'error': message, 'retryAfter': retry_after})
+    response.status_code = status_code
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def _create_bucket_store():
+    if RATE_LIMIT_STORE == "mongo":
+        return MongoBucketStore(get_collection("rate_limits"))
+    return MemoryBucketStore()
+
+
+def init_rate_limiting(app):
+    """Install per-client token buckets and admission control on the Flask app"""
+    if not RATE_LIMIT_ENABLED:
+        print("Rate limiting disabled", flush=True)
+        return
+
+    bucket_store = _create_bucket_store()
+    admission = AdmissionController(MAX_CONCURRENT_REQUESTS, RESERVED_PRIORITY_SLOTS, ROUTE_CONCURRENCY)
+
+    @app.before_request
+    def admit_request():
+        # CORS preflights are cheap and must never be throttled
+        if request.method == 'OPTIONS' or request.endpoint is None:
+            return None
+
+        route_class = ROUTE_CLASSES.get(request.endpoint, "default")
+        capacity, refill_rate = RATE_LIMITS[route_class]
+
+        try:
+            retry_after = bucket_store.take(_client_key(route_class), capacity, refill_rate)
+        except PyMongoError as e:
+            # Fail open - a rate limiter outage must not take checkout down with it
+            print(f"Rate limit store unavailable: {e}", flush=True)
+            retry_after = 0
+
+        if retry_after:
+            print(f"Rate limited {request.endpoint} for {_client_key(route_class)}", flush=True)
+            return _rejection(429, 'Too many requests', math.ceil(retry_after))
+
+        if not admission.try_acquire(route_class, route_class in PRIORITY_ROUTES):
+            print(f"Shedding {request.endpoint} - server at capacity", flush=True)
+            return _rejection(503, 'Server busy, please retry', 1)
+
+        g.admitted_route_class = route_class
+        return None
+
+    @app.teardown_request
+    def release_request(exc):
+        route_class = g.pop('admitted_route_class', None)
+        if route_class is not None:
+            admission.release(route_class)
+
+    print(f"Rate limiting enabled ({RATE_LIMIT_STORE} store, {MAX_CONCURRENT_REQUESTS} concurrent requests)", flush=True)
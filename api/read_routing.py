@@ -0,0 +1,73 @@
+from flask import session
+from bson import json_util
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+from contextlib import contextmanager
+from .mongo import get_client
+import os
+
+# Read preference per route - override any of them with READ_PREFERENCE_<ROUTE>,
+# e.g. READ_PREFERENCE_CATALOG=nearest. Anything not listed reads from the primary.
+ROUTE_READ_PREFERENCES = {
+    "catalog": os.getenv("READ_PREFERENCE_CATALOG", "secondaryPreferred"),
+    "customer_orders": os.getenv("READ_PREFERENCE_CUSTOMER_ORDERS", "secondaryPreferred"),
+    "order_details": os.getenv("READ_PREFERENCE_ORDER_DETAILS", "secondaryPreferred"),
+    "export": os.getenv("READ_PREFERENCE_EXPORT", "secondaryPreferred"),
+}
+
+# Bounded staleness for secondary reads (MongoDB requires at least 90 seconds)
+MAX_STALENESS_SECONDS = max(int(os.getenv("READ_MAX_STALENESS_SECONDS", "90")), 90)
+
+READ_PREFERENCE_MODES = {
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# Key in the Flask session holding the cluster/operation time of the customer's last write
+CAUSAL_TOKEN_KEY = 'causalToken'
+
+
+def read_preference_for(route):
+    mode = ROUTE_READ_PREFERENCES.get(route, "primary")
+    if mode not in READ_PREFERENCE_MODES:
+        return Primary()
+    return READ_PREFERENCE_MODES[mode](max_staleness=MAX_STALENESS_SECONDS)
+
+
+def for_route(collection, route):
+    """Return the collection bound to the read preference configured for a route"""
+    return collection.with_options(read_preference=read_preference_for(route))
+
+
+@contextmanager
+def causal_session():
+    """Causally consistent session that continues from the customer's last write.
+
+    Reads made with this session wait until the chosen member has caught up to
+    the stored operation time, so a customer who has just placed an order sees
+    it even when their order reads are served by a secondary.
+    """
+    with get_client().start_session(causal_consistency=True) as mongo_session:
+        token = session.get(CAUSAL_TOKEN_KEY)
+        if token:
+            try:
+                times = json_util.loads(token)
+                if times.get('clusterTime'):
+                    mongo_session.advance_cluster_time(times['clusterTime'])
+                if times.get('operationTime'):
+                    mongo_session.advance_operation_time(times['operationTime'])
+            except Exception as e:
+                print(f"Ignoring unreadable causal token: {e}", flush=True)
+        yield mongo_session
+
+
+def remember_causal_token(mongo_session):
+    """Store the session's cluster/operation time so the customer's next reads follow this write"""
+    if mongo_session.operation_time is None:
+        # Standalone servers do not report operation times - nothing to wait for
+        return
+    session[CAUSAL_TOKEN_KEY] = json_util.dumps({
+        'clusterTime': mongo_session.cluster_time,
+        'operationTime': mongo_session.operation_time
+    })
@@ -1,6 +1,6 @@
 'use client'
 
-import { useEffect, useState } from 'react'
+import { useEffect, useRef, useState } from 'react'
 import { useRouter } from 'next/navigation'
 import BookCard from '@/components/BookCard'
 import Cart from '@/components/Cart'
@@ -36,6 +36,13 @@ export default function NewOrderPage() {
   const [isCartOpen, setIsCartOpen] = useState(false)
   const [purchasing, setPurchasing] = useState(false)
   const [error, setError] = useState<string | null>(null)
+  // Reused when the same cart is submitted again (e.g. after a timeout) so it cannot create a second order
+  const checkoutKey = useRef<string | null>(null)
+
+  useEffect(() => {
+    // A different cart is a different order
+    checkoutKey.current = null
+  }, [cart])
 
   useEffect(() => {
     // Check if user is logged in - direct Flask connection
@@ -248,6 +255,8 @@ export default function NewOrderPage() {
     }
 
     setPurchasing(true)
+    const idempotencyKey = checkoutKey.current ?? crypto.randomUUID()
+    checkoutKey.current = idempotencyKey
     try {
       const orderData = {
         customerID: currentUser.CustomerID,
@@ -257,24 +266,51 @@ export default function NewOrderPage() {
         }))
       }
 
+      // Re-validate the whole cart first so a stale cart never reaches the order write path
+      const quoteResponse = await fetch('http://localhost:5000/api/orders/quote', {
+        method: 'POST',
+        mode: 'cors',
+        credentials: 'include',
+        headers: {
+          'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(orderData)
+      })
+
+      if (quoteResponse.ok) {
+        const quote = await quoteResponse.json()
+        if (!quote.valid) {
+          alert(`Please update your cart:\n${quote.errors.join('\n')}`)
+          fetchBooks()
+          return
+        }
+      }
+
       // Direct Flask connection - no proxy complications!
       const response = await fetch('http://localhost:5000/api/orders/create', {
         method: 'POST',
         mode: 'cors',
         credentials: 'include',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          'Idempotency-Key': idempotencyKey
         },
         body: JSON.stringify(orderData)
       })
 
       if (response.ok) {
         const result = await response.json()
-        alert(`Order #${result.orderID} created successfully!`)
+        if (result.status === 'queued') {
+          alert(`Order #${result.orderID} received! It is being processed.`)
+        } else {
+          alert(`Order #${result.orderID} created successfully!`)
+        }
         setCart([])
         setIsCartOpen(false)
         fetchBooks()
       } else {
+        // Nothing was ordered - the next attempt is a new request, not a replay of this one
+        checkoutKey.current = null
         const error = await response.json()
         alert(`Failed to create order: ${error.error}`)
       }